@@ -1,7 +1,10 @@
-from dbus_next.service import ServiceInterface, method
-from dbus_next.aio import MessageBus
-from dbus_next.constants import BusType
 import logging
+from typing import Optional
+
+from dbus_next.aio import MessageBus
+from dbus_next.service import ServiceInterface, method
+
+from .system_bus import SystemBus
 
 
 class BleAgentService:
@@ -14,16 +17,17 @@ class BleAgentService:
         def RequestConfirmation(self, device: "o", passkey: "u"):  # type: ignore
             self.logger.info(f"RequestConfirmation ({device}, {passkey})")
 
-    def __init__(self) -> None:
+    def __init__(self, system_bus: Optional[SystemBus] = None) -> None:
         self.logger = logging.getLogger(name=__name__)
+        self.system_bus = system_bus or SystemBus()
         self.bus: MessageBus
         self.agent: BleAgentService.Agent
 
     async def unregister_all_agents(self) -> None:
         try:
-            introspection = await self.bus.introspect("org.bluez", "/org/bluez")
-            obj = self.bus.get_proxy_object("org.bluez", "/org/bluez", introspection)
-            manager = obj.get_interface("org.bluez.AgentManager1")
+            manager = await self.system_bus.get_interface(
+                "org.bluez", "/org/bluez", "org.bluez.AgentManager1"
+            )
             await manager.call_unregister_agent("/org/bluez/anAgent")  # type: ignore
             self.logger.info("Existing agent unregistered")
         except Exception as e:
@@ -31,7 +35,7 @@ class BleAgentService:
 
     async def register_agent(self) -> None:
         self.logger.info("Registering agent...")
-        self.bus = await MessageBus(bus_type=BusType.SYSTEM).connect()
+        self.bus = await self.system_bus.get_bus()
 
         # name_request_reply = await self.bus.request_name("it.remote.AgentService")
         # self.logger.info(f"Bus name: {self.bus.unique_name}")
@@ -40,9 +44,9 @@ class BleAgentService:
         export_response = self.bus.export("/it/remote/BleAgent", self.agent)
         self.logger.info(f"Export response: {export_response}")
 
-        introspection = await self.bus.introspect("org.bluez", "/org/bluez")
-        obj = self.bus.get_proxy_object("org.bluez", "/org/bluez", introspection)
-        manager = obj.get_interface("org.bluez.AgentManager1")
+        manager = await self.system_bus.get_interface(
+            "org.bluez", "/org/bluez", "org.bluez.AgentManager1"
+        )
 
         register_response = await manager.call_register_agent("/it/remote/BleAgent", "DisplayYesNo")  # type: ignore
         self.logger.info(f"Register response: {register_response}")
@@ -0,0 +1,139 @@
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from dbus_next import Message, MessageType, Variant
+
+from .system_bus import SystemBus
+
+
+BLUEZ_SERVICE = "org.bluez"
+DEVICE_INTERFACE = "org.bluez.Device1"
+GATT_CHARACTERISTIC_INTERFACE = "org.bluez.GattCharacteristic1"
+OBJECT_MANAGER_INTERFACE = "org.freedesktop.DBus.ObjectManager"
+PROPERTIES_INTERFACE = "org.freedesktop.DBus.Properties"
+
+
+def unwrap(value: Any) -> Any:
+    return value.value if isinstance(value, Variant) else value
+
+
+def device_path_of(path: str) -> str:
+    # /org/bluez/hci0/dev_XX_XX/service0010/char0011 -> /org/bluez/hci0/dev_XX_XX
+    parts = path.split("/")
+    for index, part in enumerate(parts):
+        if part.startswith("dev_"):
+            return "/".join(parts[: index + 1])
+    return path
+
+
+class BleConnectionService:
+    """Tracks connected centrals and their negotiated ATT MTU through BlueZ."""
+
+    def __init__(self, system_bus: Optional[SystemBus] = None) -> None:
+        self.logger = logging.getLogger(name=__name__)
+        self.system_bus = system_bus or SystemBus()
+        # Device object path -> address, for every connected central
+        self.connected: Dict[str, str] = {}
+        # Device object path -> negotiated ATT MTU
+        self.mtus: Dict[str, int] = {}
+        self.on_connect: Callable[[str, str], None] = lambda path, address: None
+        self.on_disconnect: Callable[[str, str], None] = lambda path, address: None
+
+    def get_address(self, device: str) -> Optional[str]:
+        # Address of a connected central from its object path
+        return self.connected.get(device)
+
+    def get_mtu(self, device: Optional[str] = None) -> Optional[int]:
+        # Without a device use the smallest MTU so every central can read it,
+        # a device is either its BlueZ object path or its address
+        if device is not None:
+            if device in self.mtus:
+                return self.mtus[device]
+            for path, address in self.connected.items():
+                if address == device and path in self.mtus:
+                    return self.mtus[path]
+            return None
+        mtus = [self.mtus[path] for path in self.connected if path in self.mtus]
+        return min(mtus) if mtus else None
+
+    def update_device(self, path: str, properties: Dict[str, Any]) -> None:
+        if "Address" in properties and path in self.connected:
+            self.connected[path] = unwrap(properties["Address"])
+        if "Connected" in properties:
+            if unwrap(properties["Connected"]):
+                address = unwrap(properties.get("Address", "")) or self.connected.get(
+                    path, ""
+                )
+                known = path in self.connected
+                self.connected[path] = address
+                if not known:
+                    self.logger.debug(f"Central connected: {path}")
+                    self.on_connect(path, address)
+            elif path in self.connected:
+                address = self.connected.pop(path)
+                self.mtus.pop(path, None)
+                self.logger.debug(f"Central disconnected: {path}")
+                self.on_disconnect(path, address)
+
+    def update_mtu(self, path: str, properties: Dict[str, Any]) -> None:
+        if "MTU" in properties:
+            device_path = device_path_of(path)
+            mtu = int(unwrap(properties["MTU"]))
+            if self.mtus.get(device_path) != mtu:
+                self.mtus[device_path] = mtu
+                self.logger.debug(f"Negotiated MTU for {device_path}: {mtu}")
+
+    def update_interfaces(
+        self, path: str, interfaces: Dict[str, Dict[str, Any]]
+    ) -> None:
+        if DEVICE_INTERFACE in interfaces:
+            self.update_device(path, interfaces[DEVICE_INTERFACE])
+        if GATT_CHARACTERISTIC_INTERFACE in interfaces:
+            self.update_mtu(path, interfaces[GATT_CHARACTERISTIC_INTERFACE])
+
+    def handle_message(self, message: Message) -> None:
+        # The bus is shared, so skip signals of other services
+        if message.message_type != MessageType.SIGNAL or message.path is None:
+            return
+        if not message.path.startswith("/org/bluez") and message.path != "/":
+            return
+        if message.member == "InterfacesAdded":
+            path, interfaces = message.body
+            self.update_interfaces(path, interfaces)
+        elif message.member == "InterfacesRemoved":
+            path, interfaces = message.body
+            if DEVICE_INTERFACE in interfaces:
+                self.update_device(path, {"Connected": False})
+                self.system_bus.invalidate(BLUEZ_SERVICE, path)
+        elif message.member == "PropertiesChanged":
+            interface, changed, _ = message.body
+            if interface == DEVICE_INTERFACE:
+                self.update_device(message.path, changed)
+            elif interface == GATT_CHARACTERISTIC_INTERFACE:
+                self.update_mtu(message.path, changed)
+
+    async def monitor_connections(self) -> None:
+        bus = await self.system_bus.get_bus()
+
+        # Subscribe before listing so no change is lost in between
+        await self.system_bus.add_match(
+            f"type='signal',sender='{BLUEZ_SERVICE}',"
+            f"interface='{OBJECT_MANAGER_INTERFACE}'",
+        )
+        await self.system_bus.add_match(
+            f"type='signal',sender='{BLUEZ_SERVICE}',"
+            f"interface='{PROPERTIES_INTERFACE}',member='PropertiesChanged'",
+        )
+        bus.add_message_handler(self.handle_message)
+
+        manager = await self.system_bus.get_interface(
+            BLUEZ_SERVICE, "/", OBJECT_MANAGER_INTERFACE
+        )
+        objects = await manager.call_get_managed_objects()  # type: ignore
+
+        for path, interfaces in objects.items():
+            if DEVICE_INTERFACE in interfaces:
+                self.update_interfaces(path, interfaces)
+        for path, interfaces in objects.items():
+            if GATT_CHARACTERISTIC_INTERFACE in interfaces:
+                self.update_interfaces(path, interfaces)
@@ -0,0 +1,233 @@
+import struct
+import zlib
+from typing import Optional, Union
+
+
+# Enum for the message framing protocol
+class Protocol:
+    LEGACY = "LEGACY"
+    FRAMED = "FRAMED"
+
+
+# Enum for the payload encoding of the WiFi list and status characteristics
+class Encoding:
+    JSON = "JSON"
+    DEFLATE = "DEFLATE"
+
+
+START_MARKER = b"[START]"
+END_MARKER = b"[END]"
+
+# Framed chunks start with a magic byte that can never appear in UTF-8 text,
+# so they are distinguishable from legacy [START]/[END] chunks.
+# Header layout: magic, version, message id, sequence number, total length
+FRAME_MAGIC = 0xFE
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct(">BBBHH")
+MAX_FRAMED_LENGTH = 0xFFFF
+
+
+class FramingError(Exception):
+    pass
+
+
+def is_framed(value: Union[bytes, bytearray]) -> bool:
+    return len(value) > 0 and value[0] == FRAME_MAGIC
+
+
+def encode_payload(data: str, encoding: str) -> bytes:
+    payload = data.encode("utf-8")
+    if encoding == Encoding.DEFLATE:
+        # Raw deflate stream, without zlib header or checksum
+        compressor = zlib.compressobj(zlib.Z_BEST_COMPRESSION, zlib.DEFLATED, -15)
+        return compressor.compress(payload) + compressor.flush()
+    return payload
+
+
+def utf8_boundary(data: bytes, index: int) -> int:
+    # Move the index back so it does not split a multi-byte UTF-8 character
+    while 0 < index < len(data) and (data[index] & 0xC0) == 0x80:
+        index -= 1
+    return index
+
+
+class OutgoingMessage:
+    """Pre-encoded message handed out to the client chunk by chunk."""
+
+    def __init__(self, data: bytes, protocol: str, message_id: int = 0) -> None:
+        self.protocol = protocol
+        self.message_id = message_id & 0xFF
+        self.sequence = 0
+        self.index = 0
+        if protocol == Protocol.FRAMED:
+            if len(data) > MAX_FRAMED_LENGTH:
+                raise FramingError(f"Message too long to frame: {len(data)} bytes")
+            self.data = data
+            self.trailer = b""
+        else:
+            # Legacy clients look for the end marker within a single chunk, so
+            # it is never split
+            self.data = START_MARKER + data
+            self.trailer = END_MARKER
+
+    @property
+    def remaining(self) -> int:
+        return len(self.data) - self.index + len(self.trailer)
+
+    @property
+    def done(self) -> bool:
+        return (
+            self.index >= len(self.data)
+            and not self.trailer
+            and (self.sequence > 0 or self.protocol == Protocol.LEGACY)
+        )
+
+    def next_chunk(self, chunk_size: int) -> bytearray:
+        if self.protocol == Protocol.FRAMED:
+            payload_size = max(chunk_size - FRAME_HEADER.size, 1)
+            end = min(self.index + payload_size, len(self.data))
+            chunk = bytearray(
+                FRAME_HEADER.pack(
+                    FRAME_MAGIC,
+                    FRAME_VERSION,
+                    self.message_id,
+                    self.sequence,
+                    len(self.data),
+                )
+            )
+        else:
+            end = utf8_boundary(self.data, self.index + chunk_size)
+            if end <= self.index and self.index < len(self.data):
+                # A chunk smaller than one character, send it split anyway
+                end = self.index + chunk_size
+            chunk = bytearray()
+
+        chunk += self.data[self.index : end]
+        self.index = end
+        if self.index >= len(self.data) and len(chunk) + len(self.trailer) <= max(
+            chunk_size, len(self.trailer)
+        ):
+            # After the last data, in the same chunk when it fits or on its own
+            chunk += self.trailer
+            self.trailer = b""
+        self.sequence += 1
+        return chunk
+
+
+class LegacyAssembler:
+    """Reassembles messages wrapped in [START]/[END] markers."""
+
+    protocol = Protocol.LEGACY
+
+    def __init__(self, max_size: int = MAX_FRAMED_LENGTH) -> None:
+        self.max_size = max_size
+        self.buffer = bytearray()
+        self.receiving = False
+
+    @property
+    def size(self) -> int:
+        return len(self.buffer)
+
+    def feed(self, value: bytes) -> Optional[bytes]:
+        if START_MARKER in value:
+            if self.receiving:
+                # Cancel/Fail the current transmission if already receiving
+                self.reset()
+                raise FramingError(
+                    "New start marker received before finishing the current message"
+                )
+            self.receiving = True
+            self.buffer = bytearray()
+            value = value.replace(START_MARKER, b"")
+
+        if not self.receiving:
+            return None
+
+        if END_MARKER in value:
+            self.buffer += value.replace(END_MARKER, b"")
+            if len(self.buffer) > self.max_size:
+                self.reset()
+                raise FramingError(f"Message exceeds {self.max_size} bytes")
+            message = bytes(self.buffer)
+            self.reset()
+            return message
+
+        self.buffer += value
+        if len(self.buffer) > self.max_size:
+            self.reset()
+            raise FramingError(f"Message exceeds {self.max_size} bytes")
+        return None
+
+    def reset(self) -> None:
+        self.buffer = bytearray()
+        self.receiving = False
+
+
+class FrameAssembler:
+    """Reassembles length-prefixed frames into a preallocated buffer."""
+
+    protocol = Protocol.FRAMED
+
+    def __init__(self, max_size: int = MAX_FRAMED_LENGTH) -> None:
+        self.max_size = max_size
+        self.buffer: Optional[bytearray] = None
+        self.message_id = 0
+        self.expected_sequence = 0
+        self.received = 0
+
+    @property
+    def size(self) -> int:
+        return len(self.buffer) if self.buffer is not None else 0
+
+    def feed(self, value: bytes) -> Optional[bytes]:
+        if len(value) < FRAME_HEADER.size:
+            self.reset()
+            raise FramingError(f"Frame shorter than header: {len(value)} bytes")
+
+        _, version, message_id, sequence, total_length = FRAME_HEADER.unpack_from(value)
+        if version != FRAME_VERSION:
+            self.reset()
+            raise FramingError(f"Unsupported frame version: {version}")
+
+        if sequence == 0:
+            if self.buffer is not None:
+                self.reset()
+                raise FramingError(
+                    "New message started before finishing the current message"
+                )
+            if total_length > self.max_size:
+                raise FramingError(f"Message exceeds {self.max_size} bytes")
+            self.buffer = bytearray(total_length)
+            self.message_id = message_id
+            self.expected_sequence = 0
+            self.received = 0
+        elif self.buffer is None:
+            raise FramingError(f"Frame {sequence} received without a start frame")
+        elif message_id != self.message_id or sequence != self.expected_sequence:
+            self.reset()
+            raise FramingError(
+                f"Unexpected frame {message_id}/{sequence}, expected "
+                f"{self.message_id}/{self.expected_sequence}"
+            )
+
+        payload = memoryview(value)[FRAME_HEADER.size :]
+        end = self.received + len(payload)
+        if end > len(self.buffer):
+            self.reset()
+            raise FramingError("Frame payload exceeds the announced message length")
+
+        self.buffer[self.received : end] = payload
+        self.received = end
+        self.expected_sequence += 1
+
+        if self.received < len(self.buffer):
+            return None
+
+        message = bytes(self.buffer)
+        self.reset()
+        return message
+
+    def reset(self) -> None:
+        self.buffer = None
+        self.expected_sequence = 0
+        self.received = 0
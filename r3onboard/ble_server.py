@@ -1,14 +1,9 @@
 import asyncio
-
-import socket
-import sys
-from configobj import ConfigObj
-from dbus_next.aio import MessageBus
-from dbus_next import InterfaceNotFoundError, Variant
-from dbus_next.constants import BusType
 import json
 import logging
 import os
+import socket
+import sys
 from typing import Any, Dict, Optional
 
 from bless import BlessServer  # type: ignore
@@ -17,11 +12,33 @@ from bless.backends.characteristic import (
     GATTAttributePermissions,
     GATTCharacteristicProperties,
 )
+from configobj import ConfigObj
+from dbus_next import DBusError, Variant
 
 from r3onboard.ble_agent_service import BleAgentService
 
+from . import gatt_options
+from .ble_connection_service import BleConnectionService, unwrap
+from .ble_framing import (
+    FRAME_HEADER,
+    Encoding,
+    FrameAssembler,
+    FramingError,
+    LegacyAssembler,
+    OutgoingMessage,
+    Protocol,
+    is_framed,
+)
+from .ble_session import Session, SessionTable
+from .command_dispatcher import CommandDispatcher
 from .network_manager_service import NetworkManagerService
+from .notification_queue import NotificationQueue
+from .notification_scheduler import NotificationScheduler
 from .remoteit_service import RemoteItService
+from .snapshot_store import Snapshot, SnapshotStore
+from .state_store import StateStore
+from .system_bus import SystemBus
+
 
 CONFIG_FILE = "/etc/r3onboard/config.ini"
 DEFAULT_CONFIG_FILE = "/etc/r3onboard/config.ini.default"
@@ -30,6 +47,25 @@ DEFAULT_SETTINGS = {
     "Settings": {
         "Duration": "5min",
         "LogLevel": "info",
+        "DefaultMtu": "251",
+        "MinChunkSize": "20",
+        "MaxChunkSize": "509",
+        "NotifyDebounceMs": "100",
+        "NotifyPacingMs": "0",
+        "MaxMessageSize": "8192",
+        "SessionMemoryBudget": "65536",
+        "SessionIdleTimeout": "60s",
+        "MaxScanResults": "64",
+        "ScanIntervalActive": "30s",
+        "ScanIntervalIdle": "5m",
+        "ScanIntervalConnected": "10m",
+        "ScanResultTtl": "15m",
+        "ConnectTimeout": "45s",
+        "InstallerSource": "",
+        "InstallerSha256": "",
+        "InstallerCacheTtl": "24h",
+        "StateFile": "/var/lib/r3onboard/state.json",
+        "StateSaveDelay": "5s",
     }
 }
 
@@ -40,6 +76,8 @@ class Commands:
     WIFI_CONNECT = "WIFI_CONNECT"
     R3_REGISTER = "R3_REGISTER"
     IS_CONNECTED = "IS_CONNECTED"
+    SET_ENCODING = "SET_ENCODING"
+    WIFI_LIST_QUERY = "WIFI_LIST_QUERY"
 
 
 class BleServer:
@@ -51,11 +89,15 @@ class BleServer:
     WIFI_LIST_CHARACTERISTIC_UUID = f"0000a004{BASE_UUID}"
     REGISTRATION_STATUS_CHARACTERISTIC_UUID = f"0000a011{BASE_UUID}"
     COMMAND_CHARACTERISTIC_UUID = f"0000a020{BASE_UUID}"
+    COMMAND_STREAM_CHARACTERISTIC_UUID = f"0000a021{BASE_UUID}"
 
-    START_MARKER = "[START]"
-    END_MARKER = "[END]"
+    # ATT header bytes taken from the MTU by every read response and notification
+    ATT_HEADER_SIZE = 3
 
-    def __init__(self, duration: str) -> None:
+    def __init__(
+        self, duration: str, settings: Optional[Dict[str, str]] = None
+    ) -> None:
+        self.settings = {**DEFAULT_SETTINGS["Settings"], **(settings or {})}
         # Get the current time and add the duration to calculate the end time
         self.duration_sec = duration_to_seconds(duration)
         if duration == "-1":
@@ -67,59 +109,185 @@ class BleServer:
         host_name = socket.gethostname()
         self.server = BlessServer(name=f"{host_name} Remote.It Onboard")
         self.logger = logging.getLogger(name=__name__)
-        self.ble_agent = BleAgentService()
-        self.network_manager = NetworkManagerService()
+        # One system bus connection for every service of the server
+        self.system_bus = SystemBus()
+        self.ble_agent = BleAgentService(self.system_bus)
+        self.ble_connections = BleConnectionService(self.system_bus)
+        self.default_mtu = int(self.settings["DefaultMtu"])
+        self.min_chunk_size = int(self.settings["MinChunkSize"])
+        self.max_chunk_size = int(self.settings["MaxChunkSize"])
+        # Scans, connects and registrations each run one at a time, and a scan
+        # never runs during a connection attempt, they share the radio
+        self.commands = CommandDispatcher(
+            groups={Commands.WIFI_SCAN: "radio", Commands.WIFI_CONNECT: "radio"}
+        )
+        # Registration code of the registration in flight
+        self.registration_code: Optional[str] = None
+        self.scan_scheduler: Optional[asyncio.Task] = None
+        self.notification_queue = NotificationQueue(
+            self.send_chunk, int(self.settings["NotifyPacingMs"]) / 1000
+        )
+        self.notifications = NotificationScheduler(
+            int(self.settings["NotifyDebounceMs"]) / 1000, self.send_notification
+        )
+        self.network_manager = NetworkManagerService(
+            self.system_bus, int(self.settings["MaxScanResults"])
+        )
         self.network_manager.on_change_network = self.on_change_network
+        self.network_manager.active_scan_interval = duration_to_seconds(
+            self.settings["ScanIntervalActive"]
+        )
+        self.network_manager.idle_scan_interval = duration_to_seconds(
+            self.settings["ScanIntervalIdle"]
+        )
+        self.network_manager.connected_scan_interval = duration_to_seconds(
+            self.settings["ScanIntervalConnected"]
+        )
+        self.network_manager.scan_result_ttl = duration_to_seconds(
+            self.settings["ScanResultTtl"]
+        )
+        self.network_manager.connect_timeout = duration_to_seconds(
+            self.settings["ConnectTimeout"]
+        )
         self.remoteit_registration = RemoteItService()
         self.remoteit_registration.on_change_registration = self.on_change_registration
-        self.buffers: dict = {}
-        self.receiving_states: dict = {}
+        installer_cache = self.remoteit_registration.installer_cache
+        installer_cache.source_dir = self.settings["InstallerSource"] or None
+        installer_cache.sha256 = self.settings["InstallerSha256"].lower() or None
+        installer_cache.max_age = duration_to_seconds(
+            self.settings["InstallerCacheTtl"]
+        )
+        # Reassembly buffers and read cursors of each connected central
+        self.sessions = SessionTable(
+            int(self.settings["MaxMessageSize"]),
+            int(self.settings["SessionMemoryBudget"]),
+            duration_to_seconds(self.settings["SessionIdleTimeout"]),
+        )
+        self.ble_connections.on_connect = self.on_connect_device
+        self.ble_connections.on_disconnect = self.on_disconnect_device
+        # Notifications use the framing of the last message received from any
+        # client, back to legacy once every client has left
+        self.protocol = Protocol.LEGACY
+        self.message_id = 0
+        # Encoding of the WiFi list and status notifications, that of the client
+        # which sent the last message. Reads use the encoding of the reader.
+        self.encoding = Encoding.JSON
+        # Characteristic values are served from snapshots rebuilt on state changes
+        self.snapshots = SnapshotStore()
+        self.notified_versions: Dict[str, int] = {}
+        # The last known state is served until fresh data arrives
+        self.state_store = StateStore(self.settings["StateFile"])
+        self.state_saves = NotificationScheduler(
+            duration_to_seconds(self.settings["StateSaveDelay"]), self.save_state
+        )
+        self.restore_state()
+        self.update_snapshots()
 
     def on_change_network(self, var_name: str, value: str) -> None:
         self.logger.debug(f"{var_name} has been updated to {value}")
-        asyncio.create_task(self.run_notify_wifi())
+        if var_name == "wifi_status":
+            # The SSID only changes along with the link, refresh it off the read path
+            asyncio.create_task(self.network_manager.refresh_current_ssid())
+        if var_name in ("scan_status", "networks"):
+            self.update_wifi_list_snapshot()
+        if self.update_wifi_status_snapshot():
+            self.notifications.schedule(self.WIFI_STATUS_CHARACTERISTIC_UUID)
+        self.schedule_state_save()
 
     def on_change_registration(self, var_name: str, value: str) -> None:
         self.logger.debug(f"{var_name} has been updated to {value}")
-        asyncio.create_task(self.run_notify_registration())
+        if self.update_registration_snapshot():
+            self.notifications.schedule(self.REGISTRATION_STATUS_CHARACTERISTIC_UUID)
+        self.schedule_state_save()
+
+    def restore_state(self) -> None:
+        state = self.state_store.load()
+        if state is None:
+            return
+        self.logger.info(f"Restoring state saved at {state.get('saved_at')}")
+        self.network_manager.restore_state(state.get("network", {}))
+        self.remoteit_registration.restore_state(state.get("registration", {}))
+
+    def collect_state(self) -> Dict[str, Any]:
+        return {
+            "network": self.network_manager.export_state(),
+            "registration": self.remoteit_registration.export_state(),
+        }
 
-    async def run_notify_wifi(self) -> None:
-        def notify_wifi() -> None:
-            self.logger.debug("Setting Wifi Status Characteristic")
-            self.notify(
-                self.WIFI_STATUS_CHARACTERISTIC_UUID, self.create_wifi_status_json()
-            )
+    def schedule_state_save(self) -> None:
+        if self.state_store.path:
+            self.state_saves.schedule("state")
 
-        loop = asyncio.get_running_loop()
-        await loop.run_in_executor(None, notify_wifi)
+    async def save_state(self, key: str) -> None:
+        if self.state_store.save(self.collect_state()):
+            self.logger.debug("State saved")
 
-    async def run_notify_registration(self) -> None:
-        def notify_registration() -> None:
-            self.logger.debug("Setting Registration Status Characteristic")
-            registration_status = {
-                "reg": self.remoteit_registration.registration_status,
-                "id": self.remoteit_registration.device_id,
-            }
-            self.notify(
-                self.REGISTRATION_STATUS_CHARACTERISTIC_UUID,
-                json.dumps(registration_status),
-            )
+    def update_wifi_status_snapshot(self) -> bool:
+        previous = self.snapshots.get(self.WIFI_STATUS_CHARACTERISTIC_UUID)
+        snapshot = self.snapshots.update(
+            self.WIFI_STATUS_CHARACTERISTIC_UUID, self.create_wifi_status_json()
+        )
+        return snapshot is not previous
 
-        loop = asyncio.get_running_loop()
-        await loop.run_in_executor(None, notify_registration)
+    def update_wifi_list_snapshot(self) -> bool:
+        previous = self.snapshots.get(self.WIFI_LIST_CHARACTERISTIC_UUID)
+        snapshot = self.snapshots.update(
+            self.WIFI_LIST_CHARACTERISTIC_UUID, self.network_manager.get_wifi_json()
+        )
+        return snapshot is not previous
+
+    def update_registration_snapshot(self) -> bool:
+        previous = self.snapshots.get(self.REGISTRATION_STATUS_CHARACTERISTIC_UUID)
+        snapshot = self.snapshots.update(
+            self.REGISTRATION_STATUS_CHARACTERISTIC_UUID,
+            self.create_registration_status_json(),
+        )
+        return snapshot is not previous
+
+    def update_snapshots(self) -> None:
+        self.update_wifi_status_snapshot()
+        self.update_wifi_list_snapshot()
+        self.update_registration_snapshot()
+
+    async def send_notification(self, characteristic_uuid: str) -> None:
+        snapshot = self.snapshots.get(characteristic_uuid)
+        if snapshot is None:
+            return
+        if self.notified_versions.get(characteristic_uuid) == snapshot.version:
+            # The client already has this version
+            return
+        self.notified_versions[characteristic_uuid] = snapshot.version
+        self.logger.debug(f"Notifying {characteristic_uuid} v{snapshot.version}")
+        await self.notify(characteristic_uuid, snapshot)
 
     def create_wifi_status_json(self) -> str:
         self.logger.debug("Creating WiFi Status JSON.")
         wifi_status_json = {
             "wlan": self.network_manager.wifi_status,
             "eth": self.network_manager.ethernet_status,
-            "ssid": self.network_manager.get_current_ssid(),
+            "ssid": self.network_manager.current_ssid,
+            "bssid": self.network_manager.current_bssid,
+            "freq": self.network_manager.current_frequency,
+            "signal": self.network_manager.current_signal,
             "desired_ssid": self.network_manager.desired_ssid,
+            "stage": self.network_manager.connection_stage,
             "error": self.network_manager.error,
             "scan": self.network_manager.scan_status,
+            "stale": self.network_manager.stale,
         }
         return json.dumps(wifi_status_json)
 
+    def create_registration_status_json(self) -> str:
+        registration_status_json = {
+            "reg": self.remoteit_registration.registration_status,
+            "id": self.remoteit_registration.device_id,
+            "phase": self.remoteit_registration.registration_phase,
+            "progress": self.remoteit_registration.registration_progress,
+            "error": self.remoteit_registration.registration_error,
+            "stale": self.remoteit_registration.stale,
+        }
+        return json.dumps(registration_status_json)
+
     def write_request(
         self,
         characteristic: BlessGATTCharacteristic,
@@ -134,61 +302,126 @@ class BleServer:
         self.end_time = int(asyncio.get_event_loop().time()) + self.duration_sec
 
         self.logger.debug(f"Received write on {characteristic.uuid}: {value}")
-        # Decode value from byte array to string
-
-        decoded_value = value.decode("utf-8")
-        self.logger.debug(f"Decoded value: {decoded_value}")
 
-        if characteristic.uuid not in self.buffers:
-            self.buffers[characteristic.uuid] = ""
-            self.receiving_states[characteristic.uuid] = False
+        device = self.device_of(kwargs)
+        session = self.sessions.get(device, characteristic.uuid)
+
+        # Pick the assembler matching the framing used by this chunk, framed
+        # chunks are recognized by their header, anything else is legacy
+        protocol = Protocol.FRAMED if is_framed(value) else Protocol.LEGACY
+        assembler = session.assembler
+        if assembler is None or assembler.protocol != protocol:
+            max_size = self.sessions.max_message_size
+            assembler = (
+                FrameAssembler(max_size)
+                if protocol == Protocol.FRAMED
+                else LegacyAssembler(max_size)
+            )
+            session.assembler = assembler
 
-        if self.START_MARKER in decoded_value:
-            if self.receiving_states[characteristic.uuid]:
-                # Cancel/Fail the current transmission if already receiving
-                self.logger.error(
-                    f"Transmission error: New start marker received before finishing the current message on {characteristic.uuid}."
-                )
-                self.buffers[characteristic.uuid] = ""
-                self.receiving_states[characteristic.uuid] = False
+        if characteristic.uuid == self.COMMAND_STREAM_CHARACTERISTIC_UUID:
+            message = self.feed_stream(session, bytes(value))
+        else:
+            try:
+                message = assembler.feed(bytes(value))
+            except FramingError as e:
+                self.logger.error(f"Transmission error on {characteristic.uuid}: {e}")
+                return
+        self.sessions.enforce_budget(keep=session)
+
+        if message is not None:
+            self.protocol = assembler.protocol
+            self.encoding = self.sessions.encodings.get(device, Encoding.JSON)
+            self.sessions.protocols[device] = assembler.protocol
+            try:
+                full_message = message.decode("utf-8")
+            except UnicodeDecodeError as e:
+                self.logger.error(f"Message decode error on {characteristic.uuid}: {e}")
                 return
+            self.process_full_message(characteristic, full_message, device)
 
-            self.receiving_states[characteristic.uuid] = True
-            self.buffers[characteristic.uuid] = ""
-            decoded_value = decoded_value.replace(self.START_MARKER, "")
+    def feed_stream(self, session: Session, value: bytes) -> Optional[bytes]:
+        # Chunks on the command stream are written without response, so the
+        # whole message is acknowledged, or rejected once to be sent again
+        assembler = session.assembler
+        if not isinstance(assembler, FrameAssembler):
+            self.send_stream_reply({"nack": None, "error": "Framing required"})
+            return None
 
-        if self.receiving_states[characteristic.uuid]:
-            if self.END_MARKER in decoded_value:
-                self.receiving_states[characteristic.uuid] = False
-                decoded_value = decoded_value.replace(self.END_MARKER, "")
-                self.buffers[characteristic.uuid] += decoded_value
-                self.process_full_message(characteristic)
-            else:
-                self.buffers[characteristic.uuid] += decoded_value
+        message_id, sequence = 0, 0
+        if len(value) >= FRAME_HEADER.size:
+            _, _, message_id, sequence, _ = FRAME_HEADER.unpack_from(value)
+        pending_id = assembler.message_id if assembler.buffer is not None else None
 
-    def process_full_message(self, characteristic: BlessGATTCharacteristic) -> None:
-        full_message = self.buffers[characteristic.uuid]
+        try:
+            message = assembler.feed(value)
+        except FramingError as e:
+            self.logger.error(f"Transmission error on command stream: {e}")
+            failed_id = message_id if pending_id is None else pending_id
+            if session.nacked != failed_id:
+                session.nacked = failed_id
+                self.send_stream_reply({"nack": failed_id, "error": str(e)})
+            if sequence != 0 or pending_id is None:
+                return None
+            # The previous message was cut short, start over with this one
+            try:
+                message = assembler.feed(value)
+            except FramingError as e:
+                session.nacked = message_id
+                self.send_stream_reply({"nack": message_id, "error": str(e)})
+                return None
+
+        if sequence == 0:
+            session.nacked = None
+        if message is not None:
+            self.send_stream_reply({"ack": message_id})
+        return message
+
+    def send_stream_reply(self, reply: Dict[str, Any]) -> None:
+        self.message_id = (self.message_id + 1) & 0xFF
+        message = OutgoingMessage(
+            json.dumps(reply).encode("utf-8"), Protocol.FRAMED, self.message_id
+        )
+        self.notification_queue.send(
+            self.COMMAND_STREAM_CHARACTERISTIC_UUID, message, self.chunk_size()
+        )
+
+    def process_full_message(
+        self,
+        characteristic: BlessGATTCharacteristic,
+        full_message: str,
+        device: str = "",
+    ) -> None:
         self.logger.debug(
             f"Full message received on {characteristic.uuid}: {full_message}"
         )
 
         try:
-            if characteristic.uuid == self.COMMAND_CHARACTERISTIC_UUID:
+            if characteristic.uuid in (
+                self.COMMAND_CHARACTERISTIC_UUID,
+                self.COMMAND_STREAM_CHARACTERISTIC_UUID,
+            ):
                 self.logger.debug("Command received.")
                 data = json.loads(full_message)
                 command = data["command"]
                 self.logger.debug(f"Command: {command}")
                 if command == Commands.WIFI_SCAN:
                     self.logger.info("Scan WiFi command received.")
-                    asyncio.create_task(self.network_manager.scan_wifi_networks())
+                    self.commands.single_flight(
+                        Commands.WIFI_SCAN, self.network_manager.scan_wifi_networks
+                    )
                 elif command == Commands.WIFI_CONNECT:
                     self.logger.info("Connect to WiFi command received.")
                     self.error = None
                     self.desired_ssid = data["ssid"]
-                    asyncio.create_task(
-                        self.network_manager.configure_wifi_async(
-                            self.desired_ssid, data["password"]
-                        )
+                    # The password may be omitted for a network with a saved profile
+                    ssid, password = self.desired_ssid, data.get("password", "")
+                    # A new connect supersedes the attempt in flight
+                    self.commands.replace(
+                        Commands.WIFI_CONNECT,
+                        lambda: self.network_manager.configure_wifi_async(
+                            ssid, password
+                        ),
                     )
                 elif command == Commands.R3_REGISTER:
                     code = data["code"]
@@ -197,14 +430,57 @@ class BleServer:
                         self.logger.warning("Received empty registration code.")
                         return
 
+                    if self.commands.in_flight(Commands.R3_REGISTER):
+                        if code != self.registration_code:
+                            self.logger.warning(
+                                f"Registration already running, ignoring code {code}"
+                            )
+                            return
+                    else:
+                        self.registration_code = code
+
                     self.logger.info(f"Setting Remote.It Registration Code to: {code}")
-                    asyncio.create_task(
-                        self.remoteit_registration.install_remoteit_agent_async(code)
+                    self.commands.single_flight(
+                        Commands.R3_REGISTER,
+                        lambda: self.remoteit_registration.install_remoteit_agent_async(
+                            code
+                        ),
                     )
                 elif command == Commands.IS_CONNECTED:
                     self.logger.info("Checking connection status.")
-                    self.network_manager.is_wifi_connected()
-                    self.network_manager.is_ethernet_connected()
+                    self.commands.single_flight(
+                        Commands.IS_CONNECTED, self.network_manager.check_connections
+                    )
+                elif command == Commands.SET_ENCODING:
+                    encoding = data["encoding"]
+                    if encoding not in (Encoding.JSON, Encoding.DEFLATE):
+                        self.logger.warning(f"Unsupported encoding: {encoding}")
+                        return
+                    protocol = self.sessions.protocols.get(device, Protocol.LEGACY)
+                    if encoding != Encoding.JSON and protocol != Protocol.FRAMED:
+                        # Binary payloads can not be carried by [START]/[END] markers
+                        self.logger.warning(f"{encoding} encoding requires framing.")
+                        return
+                    self.logger.info(f"Setting payload encoding to: {encoding}")
+                    self.sessions.encodings[device] = encoding
+                    self.encoding = encoding
+                elif command == Commands.WIFI_LIST_QUERY:
+                    query = {
+                        key: int(data[key])
+                        for key in ("offset", "limit", "since")
+                        if data.get(key) is not None
+                    }
+                    self.logger.info(f"Setting WiFi List query to: {query}")
+                    # An empty query switches back to the plain list
+                    if query:
+                        self.sessions.queries[device] = query
+                    else:
+                        self.sessions.queries.pop(device, None)
+                    session = self.sessions.find(
+                        device, self.WIFI_LIST_CHARACTERISTIC_UUID
+                    )
+                    if session is not None:
+                        session.outgoing = None
                 else:
                     self.logger.warning(f"Unhandled command: {command}")
             else:
@@ -217,74 +493,107 @@ class BleServer:
         except Exception as e:
             self.logger.error(f"Unexpected error: {e}")
 
-        # Clear the buffer after processing the full message
-        self.buffers[characteristic.uuid] = ""
-
-    def notify(self, characteristic_uuid: str, value: str) -> None:
-        self.create_buffer(characteristic_uuid, value)
+    async def notify(self, characteristic_uuid: str, snapshot: Snapshot) -> bool:
+        # Notifications go to every subscriber, size them for the smallest MTU
+        message = self.create_message(
+            characteristic_uuid, snapshot, self.protocol, self.encoding
+        )
+        return await self.notification_queue.send(
+            characteristic_uuid, message, self.chunk_size()
+        )
 
-        while characteristic_uuid in self.buffers:
-            characteristic = self.server.get_characteristic(characteristic_uuid)
-            if characteristic is not None:
-                characteristic.value = self.get_next_chunk(characteristic_uuid)
-                self.server.update_value(self.ONBOARD_SERVICE_UUID, characteristic_uuid)
+    def send_chunk(self, characteristic_uuid: str, chunk: bytearray) -> bool:
+        characteristic = self.server.get_characteristic(characteristic_uuid)
+        if characteristic is None:
+            return False
+        characteristic.value = chunk
+        return bool(
+            self.server.update_value(self.ONBOARD_SERVICE_UUID, characteristic_uuid)
+        )
 
     def read_request(
         self, characteristic: BlessGATTCharacteristic, **kwargs: dict[str, Any]
     ) -> bytearray:
         self.end_time = int(asyncio.get_event_loop().time()) + self.duration_sec
 
-        if self.buffers.get(characteristic.uuid) is not None:
-            return self.get_next_chunk(characteristic.uuid)
-
-        if characteristic.uuid == self.WIFI_STATUS_CHARACTERISTIC_UUID:
-            self.logger.info("Reading WiFi Status")
-            self.create_buffer(characteristic.uuid, self.create_wifi_status_json())
-        elif characteristic.uuid == self.WIFI_LIST_CHARACTERISTIC_UUID:
-            self.logger.info("Reading WiFi List")
-            # ssid = self.getNextWifi()
-            wifiList = self.network_manager.get_wifi_json()
-            self.logger.debug("ssids available: " + wifiList)
-            self.create_buffer(characteristic.uuid, wifiList)
-        elif characteristic.uuid == self.REGISTRATION_STATUS_CHARACTERISTIC_UUID:
-            self.logger.info("Reading Remote.It Registration Status")
-            # self.remoteit_registration.check_device_registration()
-            registration_status_json = {
-                "reg": self.remoteit_registration.registration_status,
-                "id": self.remoteit_registration.device_id,
-            }
-            self.create_buffer(
-                characteristic.uuid, json.dumps(registration_status_json)
-            )
-
-        return self.get_next_chunk(characteristic.uuid)
-
-    def get_next_chunk(self, characteristic_uuid: str) -> bytearray:
-        buffer = self.buffers[characteristic_uuid]
-        chunk_size = 248  # Adjust as needed
-        data = buffer["data"]
-        chunk = ""
-
-        if buffer["index"] == -1:
-            chunk += self.START_MARKER
-            buffer["index"] = 0
-            # Get the remaining size after the start marker
-
-        if buffer["index"] < len(data):
-            remaining_size = chunk_size - len(chunk)
-            chunk += data[buffer["index"] : buffer["index"] + remaining_size]
-            buffer["index"] += remaining_size
-
-        if buffer["index"] >= len(data):
-            remaining_size = chunk_size - len(chunk)
-            if remaining_size > len(self.END_MARKER):
-                chunk += self.END_MARKER
-                self.buffers.pop(characteristic_uuid)
+        chunk_size = self.chunk_size(kwargs)
+        device = self.device_of(kwargs)
+        session = self.sessions.get(device, characteristic.uuid)
+
+        if session.outgoing is None:
+            snapshot = self.snapshots.get(characteristic.uuid)
+            if snapshot is None:
+                self.logger.warning(f"Unhandled read on {characteristic.uuid}")
+                return bytearray()
+
+            query = self.sessions.queries.get(device)
+            if characteristic.uuid == self.WIFI_LIST_CHARACTERISTIC_UUID and query:
+                snapshot = Snapshot(
+                    snapshot.version,
+                    self.network_manager.get_wifi_page_json(**query),
+                )
 
-        return bytearray(chunk.encode("utf-8"))
+            self.logger.info(f"Reading {characteristic.uuid} v{snapshot.version}")
+            # A central that has not written yet may only understand legacy
+            protocol = self.sessions.protocols.get(device, Protocol.LEGACY)
+            encoding = self.sessions.encodings.get(device, Encoding.JSON)
+            session.outgoing = self.create_message(
+                characteristic.uuid, snapshot, protocol, encoding
+            )
+            self.sessions.enforce_budget(keep=session)
+
+        chunk = session.outgoing.next_chunk(chunk_size)
+        if session.outgoing.done:
+            session.outgoing = None
+        return chunk
+
+    def device_of(self, options: Dict[str, Any]) -> str:
+        # BlueZ identifies the central with its object path. Without request
+        # options all centrals share one session, keyed the same way throughout
+        # so a message in progress is never orphaned.
+        device = unwrap(options.get("device"))
+        return str(device) if device is not None else ""
+
+    def on_connect_device(self, path: str, address: str) -> None:
+        self.logger.info(f"Central {address} connected.")
+        self.network_manager.set_clients_connected(True)
+
+    def on_disconnect_device(self, path: str, address: str) -> None:
+        self.logger.info(f"Central {address} disconnected, dropping its sessions.")
+        self.sessions.remove_device(path)
+        if not self.ble_connections.connected:
+            self.sessions.clear()
+            # The next central may be a legacy one
+            self.protocol = Protocol.LEGACY
+            self.encoding = Encoding.JSON
+            self.network_manager.set_clients_connected(False)
+
+    def chunk_size(self, options: Optional[Dict[str, Any]] = None) -> int:
+        # Prefer the MTU BlueZ reports with the request, then the tracked one
+        options = {key: unwrap(value) for key, value in (options or {}).items()}
+        mtu = options.get("mtu")
+        if mtu is None:
+            mtu = self.ble_connections.get_mtu(options.get("device"))
+        if mtu is None:
+            mtu = self.default_mtu
+        chunk_size = int(mtu) - self.ATT_HEADER_SIZE
+        return max(self.min_chunk_size, min(chunk_size, self.max_chunk_size))
+
+    def create_message(
+        self,
+        characteristic_uuid: str,
+        snapshot: Snapshot,
+        protocol: str,
+        encoding: str = Encoding.JSON,
+    ) -> OutgoingMessage:
+        if protocol != Protocol.FRAMED or characteristic_uuid not in (
+            self.WIFI_STATUS_CHARACTERISTIC_UUID,
+            self.WIFI_LIST_CHARACTERISTIC_UUID,
+        ):
+            encoding = Encoding.JSON
 
-    def create_buffer(self, characteristic_uuid: str, data: str) -> None:
-        self.buffers[characteristic_uuid] = {"data": data, "index": -1}
+        self.message_id = (self.message_id + 1) & 0xFF
+        return OutgoingMessage(snapshot.encode(encoding), protocol, self.message_id)
 
     async def setup_gatt_server(self) -> None:
         gatt: dict[str, dict[str, Any]] = {
@@ -307,6 +616,14 @@ class BleServer:
                     "Permissions": GATTAttributePermissions.writeable,
                     "Value": None,
                 },
+                self.COMMAND_STREAM_CHARACTERISTIC_UUID: {
+                    "Properties": (
+                        GATTCharacteristicProperties.write_without_response
+                        | GATTCharacteristicProperties.notify
+                    ),
+                    "Permissions": GATTAttributePermissions.writeable,
+                    "Value": None,
+                },
                 self.REGISTRATION_STATUS_CHARACTERISTIC_UUID: {
                     "Properties": (
                         GATTCharacteristicProperties.notify
@@ -319,6 +636,15 @@ class BleServer:
         }
         self.server.read_request_func = self.read_request
         self.server.write_request_func = self.write_request
+        # bless creates the BlueZ application in its asynchronous setup
+        setup_task = getattr(self.server, "setup_task", None)
+        if setup_task is not None:
+            await setup_task
+        # Requests carry the central they come from, for its own session
+        if not gatt_options.install(self.server, self.read_request, self.write_request):
+            self.logger.warning(
+                "Request options unavailable, all centrals share one session."
+            )
 
         await self.server.add_gatt(gatt)
 
@@ -326,50 +652,63 @@ class BleServer:
         await self.setup_gatt_server()
         await self.server.start()
         await self.ble_agent.register_agent()
+        asyncio.create_task(self.ble_connections.monitor_connections())
         self.logger.info("BLE Server started.")
-        self.remoteit_registration.check_device_registration()
+        self.remoteit_registration.config_watcher.check()
+        asyncio.create_task(self.remoteit_registration.watch_config())
+        asyncio.create_task(self.network_manager.refresh_current_ssid())
         asyncio.create_task(self.remoteit_registration.monitor_remoteit_logs())
-        self.network_manager.is_wifi_connected()
-        self.network_manager.is_ethernet_connected()
-        asyncio.create_task(self.network_manager.scan_wifi_networks())
+        self.commands.single_flight(
+            Commands.IS_CONNECTED, self.network_manager.check_connections
+        )
+        self.commands.single_flight(
+            Commands.WIFI_SCAN, self.network_manager.scan_wifi_networks
+        )
         asyncio.create_task(self.network_manager.monitor_wifi_status())
+        asyncio.create_task(self.network_manager.monitor_saved_connections())
+        # Background scans join an explicit WIFI_SCAN already in flight
+        self.scan_scheduler = asyncio.create_task(
+            self.network_manager.schedule_scans(
+                lambda: self.commands.single_flight(
+                    Commands.WIFI_SCAN, self.network_manager.scan_wifi_networks
+                )
+            )
+        )
         self.logger.info("Tasks started.")
 
     async def disconnect_all_clients(self) -> None:
-        bus = await MessageBus(bus_type=BusType.SYSTEM).connect()
-
-        # Get the object manager
-        introspect = await bus.introspect("org.bluez", "/")
-        obj = bus.get_proxy_object("org.bluez", "/", introspect)
-        manager = obj.get_interface("org.freedesktop.DBus.ObjectManager")
+        manager = await self.system_bus.get_interface(
+            "org.bluez", "/", "org.freedesktop.DBus.ObjectManager"
+        )
 
         # Get all managed objects
         objects = await manager.call_get_managed_objects()  # type: ignore
 
         for path, interfaces in objects.items():
-            if "org.bluez.Device1" in interfaces:
-                # Get the device object and interface
+            device = interfaces.get("org.bluez.Device1")
+            # The managed objects already carry the Connected property, so no
+            # device needs to be introspected
+            if device is not None and unwrap(device.get("Connected", False)):
+                print(f"Disconnecting device {unwrap(device['Address'])}")
                 try:
-                    introspect_device = await bus.introspect("org.bluez", path)
-                    device_obj = bus.get_proxy_object(
-                        "org.bluez", path, introspect_device
+                    await self.system_bus.call(
+                        "org.bluez", path, "org.bluez.Device1", "Disconnect"
                     )
-                    device = device_obj.get_interface("org.bluez.Device1")
-
-                    # Check if the device is connected
-                    connected = await device.get_connected()  # type: ignore
-                    if connected:
-                        print(
-                            f"Disconnecting device {interfaces['org.bluez.Device1']['Address']}"
-                        )
-                        await device.call_disconnect()  # type: ignore
-                except InterfaceNotFoundError:
-                    continue
+                except DBusError as e:
+                    self.logger.debug(f"Could not disconnect {path}: {e}")
 
     async def stop_server(self) -> None:
+        if self.scan_scheduler is not None:
+            self.scan_scheduler.cancel()
+        self.commands.cancel()
+        self.notifications.cancel()
+        self.notification_queue.cancel()
+        self.state_saves.cancel()
+        self.state_store.save(self.collect_state())
         await self.disconnect_all_clients()
         await self.server.stop()
         await self.ble_agent.unregister_all_agents()
+        self.system_bus.disconnect()
 
 
 def create_default_config() -> None:
@@ -456,7 +795,7 @@ async def main() -> None:
 
     logging.info("Starting Onboard Server...")
 
-    server = BleServer(settings["Duration"])
+    server = BleServer(settings["Duration"], settings)
     await server.start()
 
     logging.info("Startup complete.")
@@ -0,0 +1,115 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from .ble_framing import FrameAssembler, LegacyAssembler, OutgoingMessage
+
+
+class Session:
+    """Reassembly and read cursor state of one central on one characteristic."""
+
+    def __init__(self, device: str, characteristic_uuid: str, now: float) -> None:
+        self.device = device
+        self.characteristic_uuid = characteristic_uuid
+        self.assembler: Optional[LegacyAssembler | FrameAssembler] = None
+        self.outgoing: Optional[OutgoingMessage] = None
+        # Last message id rejected on the command stream, so it is rejected once
+        self.nacked: Optional[int] = None
+        self.last_active = now
+
+    @property
+    def size(self) -> int:
+        size = self.assembler.size if self.assembler is not None else 0
+        if self.outgoing is not None:
+            size += self.outgoing.remaining
+        return size
+
+
+class SessionTable:
+    """Sessions keyed by (device, characteristic) with bounded memory.
+
+    Sessions idle for longer than the timeout are evicted, and when the
+    buffered bytes exceed the budget the least recently used sessions go first.
+    """
+
+    def __init__(
+        self,
+        max_message_size: int,
+        memory_budget: int,
+        idle_timeout: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.logger = logging.getLogger(name=__name__)
+        self.max_message_size = max_message_size
+        self.memory_budget = memory_budget
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self.sessions: OrderedDict[Tuple[str, str], Session] = OrderedDict()
+        # Framing last used by each device, replies are sent the same way
+        self.protocols: Dict[str, str] = {}
+        # Payload encoding negotiated by each device with SET_ENCODING
+        self.encodings: Dict[str, str] = {}
+        # WiFi List paging and delta parameters of each device, set through the
+        # COMMAND characteristic. Kept when its sessions are evicted, a read
+        # after a pause must still get the paged shape.
+        self.queries: Dict[str, Dict[str, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    @property
+    def memory_used(self) -> int:
+        return sum(session.size for session in self.sessions.values())
+
+    def get(self, device: str, characteristic_uuid: str) -> Session:
+        now = self.clock()
+        self.evict_idle(now)
+        key = (device, characteristic_uuid)
+        session = self.sessions.get(key)
+        if session is None:
+            session = Session(device, characteristic_uuid, now)
+            self.sessions[key] = session
+        else:
+            session.last_active = now
+            self.sessions.move_to_end(key)
+        return session
+
+    def find(self, device: str, characteristic_uuid: str) -> Optional[Session]:
+        return self.sessions.get((device, characteristic_uuid))
+
+    def evict_idle(self, now: Optional[float] = None) -> None:
+        now = self.clock() if now is None else now
+        # Sessions are kept in least recently used order
+        while self.sessions:
+            key, session = next(iter(self.sessions.items()))
+            if now - session.last_active < self.idle_timeout:
+                break
+            self.logger.debug(f"Evicting idle session {key}")
+            del self.sessions[key]
+            if not any(device == session.device for device, _ in self.sessions):
+                self.protocols.pop(session.device, None)
+
+    def enforce_budget(self, keep: Optional[Session] = None) -> None:
+        used = self.memory_used
+        for key, session in list(self.sessions.items()):
+            if used <= self.memory_budget:
+                break
+            if session is keep:
+                continue
+            self.logger.warning(f"Session memory over budget, evicting {key}")
+            used -= session.size
+            del self.sessions[key]
+
+    def remove_device(self, device: str) -> None:
+        for key in [key for key in self.sessions if key[0] == device]:
+            del self.sessions[key]
+        self.protocols.pop(device, None)
+        self.encodings.pop(device, None)
+        self.queries.pop(device, None)
+
+    def clear(self) -> None:
+        self.sessions.clear()
+        self.protocols.clear()
+        self.encodings.clear()
+        self.queries.clear()
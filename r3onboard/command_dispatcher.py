@@ -0,0 +1,105 @@
+import asyncio
+import logging
+from typing import Any, Callable, Coroutine, Dict, Optional
+
+
+class CommandDispatcher:
+    """Runs command coroutines with single-flight semantics.
+
+    A command started with single_flight joins the run already in flight, and a
+    command started with replace cancels it and starts over once the cancelled
+    run has finished cleaning up. Commands in the same group share its
+    concurrency limit, runs waiting for it are counted as its queue depth.
+    """
+
+    def __init__(
+        self,
+        groups: Optional[Dict[str, str]] = None,
+        limits: Optional[Dict[str, int]] = None,
+    ) -> None:
+        self.logger = logging.getLogger(name=__name__)
+        # Command -> group it shares a limit with, by default its own
+        self.groups = groups or {}
+        # Group -> runs allowed at once, 1 by default
+        self.limits = limits or {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+        # Held by the run of each command, a replacement waits for it
+        self.locks: Dict[str, asyncio.Lock] = {}
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.waiting: Dict[str, int] = {}
+
+    def group_of(self, name: str) -> str:
+        return self.groups.get(name, name)
+
+    def queue_depth(self, group: str) -> int:
+        return self.waiting.get(group, 0)
+
+    def in_flight(self, name: str) -> bool:
+        task = self.tasks.get(name)
+        return task is not None and not task.done()
+
+    def single_flight(
+        self, name: str, factory: Callable[[], Coroutine[Any, Any, Any]]
+    ) -> asyncio.Task:
+        task = self.tasks.get(name)
+        if task is not None and not task.done():
+            self.logger.info(f"{name} already running, joining it.")
+            return task
+        return self.start(name, factory)
+
+    def replace(
+        self, name: str, factory: Callable[[], Coroutine[Any, Any, Any]]
+    ) -> asyncio.Task:
+        task = self.tasks.get(name)
+        if task is not None and not task.done():
+            self.logger.info(f"{name} already running, replacing it.")
+            task.cancel()
+        return self.start(name, factory)
+
+    def start(
+        self, name: str, factory: Callable[[], Coroutine[Any, Any, Any]]
+    ) -> asyncio.Task:
+        task = asyncio.create_task(self.run(name, factory))
+        self.tasks[name] = task
+        task.add_done_callback(lambda done: self.finished(name, done))
+        return task
+
+    async def run(
+        self, name: str, factory: Callable[[], Coroutine[Any, Any, Any]]
+    ) -> Any:
+        lock = self.locks.setdefault(name, asyncio.Lock())
+        if lock.locked():
+            self.logger.debug(f"{name} waiting for the replaced run to finish.")
+        async with lock:
+            group = self.group_of(name)
+            semaphore = self.semaphores.get(group)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.limits.get(group, 1))
+                self.semaphores[group] = semaphore
+
+            self.waiting[group] = self.waiting.get(group, 0) + 1
+            if semaphore.locked():
+                self.logger.info(
+                    f"{name} waiting for {group}, queue depth {self.waiting[group]}"
+                )
+            try:
+                await semaphore.acquire()
+            finally:
+                self.waiting[group] -= 1
+            try:
+                return await factory()
+            finally:
+                semaphore.release()
+
+    def finished(self, name: str, task: asyncio.Task) -> None:
+        if self.tasks.get(name) is task:
+            del self.tasks[name]
+        if task.cancelled():
+            self.logger.debug(f"{name} cancelled.")
+        elif task.exception() is not None:
+            self.logger.error(f"{name} failed: {task.exception()}")
+
+    def cancel(self) -> None:
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks.clear()
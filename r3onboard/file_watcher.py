@@ -0,0 +1,123 @@
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+from typing import Callable, Optional, Tuple
+
+
+# inotify event masks from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_IGNORED = 0x8000
+
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class FileWatcher:
+    """Calls on_change when a file is created, replaced, changed or removed.
+
+    The directory of the file is watched with inotify, so files replaced by a
+    rename are seen too. Where inotify is not available, or the directory does
+    not exist yet, the inode, size and mtime of the file are polled instead.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        on_change: Callable[[], None],
+        poll_interval: float = 5.0,
+        safety_interval: float = 60.0,
+    ) -> None:
+        self.logger = logging.getLogger(name=__name__)
+        self.path = path
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        # Polled even with inotify, in case an event was missed
+        self.safety_interval = safety_interval
+        self.last_signature: Optional[Tuple[int, int, int]] = None
+        self.fd: Optional[int] = None
+
+    def signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def check(self) -> bool:
+        signature = self.signature()
+        if signature == self.last_signature:
+            return False
+        self.last_signature = signature
+        self.on_change()
+        return True
+
+    def open_inotify(self) -> Optional[int]:
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError, TypeError):
+            return None
+        if fd < 0:
+            return None
+        directory = os.path.dirname(self.path) or "."
+        if libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK) < 0:
+            os.close(fd)
+            return None
+        return fd
+
+    def read_events(self) -> None:
+        try:
+            data = os.read(self.fd, 4096)  # type: ignore
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size + length
+            if mask & IN_IGNORED:
+                # The directory is gone, poll until it comes back
+                self.close()
+                break
+        self.check()
+
+    def close(self) -> None:
+        if self.fd is not None:
+            asyncio.get_running_loop().remove_reader(self.fd)
+            os.close(self.fd)
+            self.fd = None
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        self.check()
+        try:
+            while True:
+                if self.fd is None:
+                    self.fd = self.open_inotify()
+                    if self.fd is not None:
+                        self.logger.debug(f"Watching {self.path} with inotify")
+                        loop.add_reader(self.fd, self.read_events)
+                        # It may have changed before the watch was added
+                        self.check()
+                await asyncio.sleep(
+                    self.poll_interval if self.fd is None else self.safety_interval
+                )
+                self.check()
+        finally:
+            self.close()
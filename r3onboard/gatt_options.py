@@ -0,0 +1,67 @@
+from typing import Any, Callable, Dict
+
+from bless.backends.bluezdbus.dbus import service as bluez_service  # type: ignore
+from bless.backends.bluezdbus.dbus.characteristic import (  # type: ignore
+    BlueZGattCharacteristic,
+)
+from dbus_next.service import method
+
+
+class OptionsGattCharacteristic(BlueZGattCharacteristic):
+    """BlueZ characteristic that hands the request options to the server.
+
+    bless drops the ReadValue/WriteValue options, among them the object path
+    of the central making the request, so the server could not tell centrals
+    apart. Applications without option aware handlers behave as with bless.
+    """
+
+    @method()
+    def ReadValue(self, options: "a{sv}") -> "ay":  # type: ignore # noqa: F722 F821
+        app = self._service.app
+        read = getattr(app, "ReadWithOptions", None)
+        if read is not None:
+            return read(self, options)
+        if app.Read is None:
+            raise NotImplementedError()
+        return app.Read(self)
+
+    @method()
+    def WriteValue(self, value: "ay", options: "a{sv}"):  # type: ignore # noqa: F722 F821
+        app = self._service.app
+        write = getattr(app, "WriteWithOptions", None)
+        if write is not None:
+            write(self, value, options)
+        elif app.Write is None:
+            raise NotImplementedError()
+        else:
+            app.Write(self, value)
+
+
+def install(
+    server: Any,
+    on_read: Callable[..., bytearray],
+    on_write: Callable[..., None],
+) -> bool:
+    # Must run after the server setup, which creates the application, and
+    # before the characteristics are added. False if nothing was installed.
+    app = getattr(server, "app", None)
+    if app is None:
+        return False
+    # bless creates its characteristics from this module attribute
+    setattr(bluez_service, "BlueZGattCharacteristic", OptionsGattCharacteristic)
+
+    def read(characteristic: BlueZGattCharacteristic, options: Dict[str, Any]) -> bytes:
+        return bytes(on_read(server.get_characteristic(characteristic.UUID), **options))
+
+    def write(
+        characteristic: BlueZGattCharacteristic,
+        value: bytes,
+        options: Dict[str, Any],
+    ) -> None:
+        on_write(
+            server.get_characteristic(characteristic.UUID), bytearray(value), **options
+        )
+
+    app.ReadWithOptions = read
+    app.WriteWithOptions = write
+    return True
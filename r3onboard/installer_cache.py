@@ -0,0 +1,127 @@
+import hashlib
+import logging
+import os
+import time
+from typing import Optional
+
+from .network_manager_service import CommandRunner
+
+
+INSTALLER_URL = "https://downloads.remote.it/remoteit/install_agent.sh"
+INSTALLER_NAME = "install_agent.sh"
+
+
+class InstallerCacheError(Exception):
+    pass
+
+
+def sha256_of(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(65536), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class InstallerCache:
+    """Content addressed cache of the remote.it agent installer.
+
+    Installers are stored by their SHA-256 and a small index names the
+    current one. A preseeded source directory is preferred over the cache and
+    the cache over a download. With an expected checksum configured, an
+    installer that does not match it is never used.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = "/var/cache/r3onboard",
+        source_dir: Optional[str] = None,
+        sha256: Optional[str] = None,
+        max_age: float = 24 * 3600,
+        url: str = INSTALLER_URL,
+    ) -> None:
+        self.logger = logging.getLogger(name=__name__)
+        self.cache_dir = cache_dir
+        self.source_dir = source_dir
+        self.sha256 = sha256.lower() if sha256 else None
+        # Without a pinned checksum a cached installer is downloaded again
+        # once it is this old (seconds)
+        self.max_age = max_age
+        self.url = url
+        self.commands = CommandRunner(limit=1, timeout=120.0)
+
+    @property
+    def index_file(self) -> str:
+        return os.path.join(self.cache_dir, f"{INSTALLER_NAME}.sha256")
+
+    def cached_path(self, sha256: str) -> str:
+        return os.path.join(self.cache_dir, f"{sha256}.sh")
+
+    def verified(self, path: str) -> Optional[str]:
+        # Checksum of the file if it exists and matches the expected one
+        try:
+            sha256 = sha256_of(path)
+        except OSError:
+            return None
+        if self.sha256 is not None and sha256 != self.sha256:
+            self.logger.warning(f"Checksum mismatch for {path}: {sha256}")
+            return None
+        return sha256
+
+    async def fetch(self) -> str:
+        if self.source_dir:
+            preseeded = os.path.join(self.source_dir, INSTALLER_NAME)
+            if self.verified(preseeded) is not None:
+                self.logger.info(f"Using preseeded installer {preseeded}")
+                return preseeded
+
+        cached = self.lookup()
+        if cached is not None:
+            self.logger.info(f"Using cached installer {cached}")
+            return cached
+        return await self.download()
+
+    def lookup(self) -> Optional[str]:
+        if self.sha256 is not None:
+            path = self.cached_path(self.sha256)
+            return path if self.verified(path) is not None else None
+
+        try:
+            with open(self.index_file, "r") as file:
+                sha256 = file.read().strip()
+            age = time.time() - os.stat(self.index_file).st_mtime
+        except OSError:
+            return None
+        if age > self.max_age:
+            return None
+        path = self.cached_path(sha256)
+        # Content addressed, the name must still match the content
+        return path if self.verified(path) == sha256 else None
+
+    async def download(self) -> str:
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        except OSError as e:
+            raise InstallerCacheError(f"Cache directory not usable: {e}")
+        partial = os.path.join(self.cache_dir, f"{INSTALLER_NAME}.partial")
+
+        self.logger.info(f"Downloading installer from {self.url}")
+        process = await self.commands.run(
+            "curl", "-fsSL", "--retry", "3", "-o", partial, self.url
+        )
+        if process.returncode != 0:
+            raise InstallerCacheError(
+                f"Download failed: {process.stderr.decode().strip()}"
+            )
+
+        sha256 = self.verified(partial)
+        if sha256 is None:
+            os.remove(partial)
+            raise InstallerCacheError("Downloaded installer failed verification")
+        path = self.cached_path(sha256)
+        os.replace(partial, path)
+        index = f"{self.index_file}.partial"
+        with open(index, "w") as file:
+            file.write(sha256)
+        os.replace(index, self.index_file)
+        return path
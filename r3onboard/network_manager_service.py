@@ -1,11 +1,62 @@
 import asyncio
-import subprocess
-import logging
 import json
-from typing import Dict, List, Tuple, Callable
+import logging
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from dbus_next import DBusError, Variant
+from dbus_next.aio.proxy_object import ProxyInterface, ProxyObject
+
+from .scan_store import ScanStore, security_of
+from .system_bus import SystemBus
+
+
+NM_SERVICE = "org.freedesktop.NetworkManager"
+NM_PATH = "/org/freedesktop/NetworkManager"
+NM_INTERFACE = "org.freedesktop.NetworkManager"
+NM_DEVICE_INTERFACE = "org.freedesktop.NetworkManager.Device"
+NM_WIRELESS_INTERFACE = "org.freedesktop.NetworkManager.Device.Wireless"
+NM_ACCESS_POINT_INTERFACE = "org.freedesktop.NetworkManager.AccessPoint"
+NM_ACTIVE_CONNECTION_INTERFACE = "org.freedesktop.NetworkManager.Connection.Active"
+NM_SETTINGS_PATH = "/org/freedesktop/NetworkManager/Settings"
+NM_SETTINGS_INTERFACE = "org.freedesktop.NetworkManager.Settings"
+NM_CONNECTION_INTERFACE = "org.freedesktop.NetworkManager.Settings.Connection"
+PROPERTIES_INTERFACE = "org.freedesktop.DBus.Properties"
+NM_DEVICE_TYPE_WIFI = 2
+
+NM_DEVICE_STATE_ACTIVATED = 100
 
-from dbus_next.aio.message_bus import MessageBus
-from dbus_next.constants import BusType
+# Device states reported while a connection is brought up
+NM_DEVICE_STAGES = {
+    40: "PREPARING",
+    50: "ASSOCIATING",
+    60: "AUTHENTICATING",
+    70: "GETTING_IP",
+    80: "CHECKING_IP",
+    90: "SECONDARIES",
+    100: "ACTIVATED",
+    110: "DEACTIVATING",
+    120: "FAILED",
+}
+
+NM_ACTIVE_CONNECTION_STATE_ACTIVATED = 2
+NM_ACTIVE_CONNECTION_STATE_DEACTIVATED = 4
+# Active connection state reasons that mean the secrets were wrong
+NM_ACTIVE_CONNECTION_REASONS_BAD_SECRETS = (9, 10)
+
+# nmcli device states and their NetworkManager state numbers
+NMCLI_DEVICE_STATES = {
+    "unmanaged": 10,
+    "unavailable": 20,
+    "disconnected": 30,
+    "connecting": 40,
+    "connected": NM_DEVICE_STATE_ACTIVATED,
+}
+# nmcli device types and the names used for them here
+NMCLI_DEVICE_TYPES = {"wifi": "wlan", "ethernet": "eth"}
+
+TERSE_SEPARATOR = re.compile(r"(?<!\\):")
 
 
 # Enum for Scan Status
@@ -23,18 +74,164 @@ class NetworkStatus:
     FAILED_START = "FAILED_START"
     INVALID_PASSWORD = "INVALID_PASSWORD"
     INVALID_SSID = "INVALID_SSID"
+    CONNECT_TIMEOUT = "CONNECT_TIMEOUT"
     UNKNOWN_ERROR = "UNKNOWN_ERROR"
 
 
+class CommandResult:
+    """Outcome of an external command run by the CommandRunner."""
+
+    def __init__(
+        self, returncode: int, stdout: bytes, stderr: bytes, elapsed: float
+    ) -> None:
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.elapsed = elapsed
+
+
+class CommandRunner:
+    """Runs external commands as subprocesses of the event loop.
+
+    At most limit commands run at once. A command is killed when it outlives
+    its timeout or when the caller is cancelled, and the time each command
+    took is logged.
+    """
+
+    def __init__(self, limit: int = 2, timeout: float = 30.0) -> None:
+        self.logger = logging.getLogger(name=__name__)
+        self.semaphore = asyncio.Semaphore(limit)
+        self.timeout = timeout
+
+    async def run(
+        self, *command: str, timeout: Optional[float] = None
+    ) -> CommandResult:
+        timeout = self.timeout if timeout is None else timeout
+        async with self.semaphore:
+            start = time.monotonic()
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                self.logger.warning(f"{command[0]} killed after {timeout}s")
+                return CommandResult(
+                    process.returncode if process.returncode is not None else -1,
+                    b"",
+                    f"Timed out after {timeout}s".encode(),
+                    time.monotonic() - start,
+                )
+            except asyncio.CancelledError:
+                # Do not leave the command running for a cancelled caller
+                process.kill()
+                await process.wait()
+                raise
+
+        elapsed = time.monotonic() - start
+        # Always set once communicate() returned
+        returncode = process.returncode if process.returncode is not None else -1
+        self.logger.debug(
+            f"{' '.join(command[:3])} exited {returncode} in {elapsed:.3f}s"
+        )
+        return CommandResult(returncode, stdout, stderr, elapsed)
+
+
+class MonitoredDevice:
+    """A NetworkManager device followed by the status monitor."""
+
+    def __init__(
+        self, path: str, device_object: ProxyObject, name: str, device_type: str
+    ) -> None:
+        self.path = path
+        self.device_object = device_object
+        self.name = name
+        self.device_type = device_type
+        # Removes the signal handlers attached for the device
+        self.detach: List[Callable[[], None]] = []
+
+
 class NetworkManagerService:
-    def __init__(self) -> None:
+    def __init__(
+        self, system_bus: Optional[SystemBus] = None, max_scan_results: int = 64
+    ) -> None:
         self.logger = logging.getLogger(name=__name__)
+        self.system_bus = system_bus or SystemBus()
+        self.commands = CommandRunner()
+        # Seconds systemd may take to restart NetworkManager
+        self.restart_timeout = 90.0
+        self.restart_lock = asyncio.Lock()
+        # Access points by BSSID, networks is the per SSID view of it
+        self.scan_results = ScanStore(max_scan_results)
         self.networks: List[Tuple[str, int]] = []
+        # Incremented once per completed scan that changed the list, the WiFi
+        # list is versioned by it. Changes in between are stamped with the
+        # generation that scan will publish.
+        self.scan_generation = 0
+        self.generation_pending = False
+        # SSID -> generation it was last added or changed in
+        self.network_generations: Dict[str, int] = {}
+        # SSID -> generation it disappeared in
+        self.removed_networks: Dict[str, int] = {}
         self._scan_status = ScanStatus.SCANNING
         self._wifi_status = NetworkStatus.NOT_CONNECTED
         self._ethernet_status = NetworkStatus.NOT_CONNECTED
         self._error: str | None = None
         self._desired_ssid: str | None = None
+        self._connection_stage = ""
+        self._current_ssid = ""
+        self.current_bssid = ""
+        self.current_frequency = 0
+        self.current_signal = 0
+        # WiFi device path -> object path of the access point it is associated
+        # with, "/" for none. Empty until followed over D-Bus.
+        self.active_access_points: Dict[str, str] = {}
+        # Interface name -> (device type, NetworkManager state), kept current by
+        # the StateChanged handlers
+        self.device_states: Dict[str, Tuple[str, int]] = {}
+        # Device type -> interfaces currently activated
+        self.connected_devices: Dict[str, Set[str]] = {}
+        self.scan_timeout = 15.0
+        # Seconds a connection attempt may take before it is given up
+        self.connect_timeout = 45.0
+        # Access point object path -> BSSID from the D-Bus scanner
+        self.access_points: Dict[str, str] = {}
+        # Access point object path -> wireless device that reported it, each
+        # device only prunes its own access points after a scan
+        self.access_point_devices: Dict[str, str] = {}
+        # Wireless device path -> removes its access point handlers
+        self.watched_wireless: Dict[str, Callable[[], None]] = {}
+        # Device path -> device followed by the status monitor
+        self.monitored_devices: Dict[str, MonitoredDevice] = {}
+        self.attaching_devices: Set[str] = set()
+        # SSID -> saved connection path, and back, kept current from the
+        # NetworkManager settings signals
+        self.saved_connections: Dict[str, str] = {}
+        self.saved_ssids: Dict[str, str] = {}
+        self.saved_connections_loaded = False
+        self.saved_connections_lock = asyncio.Lock()
+        self.devices_listed = False
+        # Background scans, often while a central is connected and backing off
+        # up to the idle interval otherwise (seconds)
+        self.active_scan_interval = 30.0
+        self.idle_scan_interval = 300.0
+        self.connected_scan_interval = 600.0
+        # Access points not seen for this long are dropped from the list
+        self.scan_result_ttl = 900.0
+        self.clients_connected = False
+        self.idle_scans = 0
+        self.last_scan = 0.0
+        # Wall clock time of the last completed scan, kept across restarts
+        self.last_scan_time: Optional[float] = None
+        self.scan_wakeup = asyncio.Event()
+        # State restored from disk is stale until the link was checked and a
+        # scan completed
+        self.stale = False
+        self.stale_parts: Set[str] = set()
         self.on_change_network: Callable[[str, str], None] = lambda x, y: None
 
     @property
@@ -82,37 +279,356 @@ class NetworkManagerService:
         self._error = value
         self.on_change_network("error", value)
 
-    def get_current_ssid(self) -> str:
+    @property
+    def connection_stage(self) -> str:
+        return self._connection_stage
+
+    @connection_stage.setter
+    def connection_stage(self, value: str) -> None:
+        if value != self._connection_stage:
+            self._connection_stage = value
+            self.on_change_network("connection_stage", value)
+
+    @property
+    def current_ssid(self) -> str:
+        return self._current_ssid
+
+    @current_ssid.setter
+    def current_ssid(self, value: str) -> None:
+        if value != self._current_ssid:
+            self._current_ssid = value
+            self.on_change_network("current_ssid", value)
+
+    def set_link(self, ssid: str, bssid: str, frequency: int, signal: int) -> None:
+        link = (bssid, frequency, signal)
+        if link != (self.current_bssid, self.current_frequency, self.current_signal):
+            self.current_bssid, self.current_frequency, self.current_signal = link
+            if ssid == self._current_ssid:
+                self.on_change_network("link", bssid)
+        self.current_ssid = ssid
+
+    async def refresh_current_ssid(self) -> None:
+        if self.active_access_points:
+            # Kept current by the ActiveAccessPoint signal
+            return
+        # Cold start fallback
+        self.current_ssid = await self.get_current_ssid()
+
+    def link_device(self) -> Optional[str]:
+        # The activated WiFi device carries the link, else any associated one
+        associated = [
+            device_path
+            for device_path, path in sorted(self.active_access_points.items())
+            if path != "/"
+        ]
+        activated = self.connected_devices.get("wlan", set())
+        for device_path in associated:
+            device = self.monitored_devices.get(device_path)
+            if device is not None and device.name in activated:
+                return device_path
+        return associated[0] if associated else None
+
+    @property
+    def active_access_point(self) -> Optional[str]:
+        # Access point of the current link
+        device_path = self.link_device()
+        if device_path is None:
+            return None
+        return self.active_access_points[device_path]
+
+    async def update_active_access_point(self, device_path: str, path: str) -> None:
+        self.active_access_points[device_path] = path
+        await self.update_link()
+
+    async def update_link(self) -> None:
+        path = self.active_access_point
+        if path is None:
+            self.set_link("", "", 0, 0)
+            return
         try:
-            self.logger.debug("Getting current SSID")
-
-            iw_output = subprocess.run(["ip", "link"], capture_output=True, text=True)
-            lines = iw_output.stdout.splitlines()
-            interface = None
-            for line in lines:
-                if "state UP" in line and "wlan" in line:
-                    interface = line.split(":")[
-                        1
-                    ].strip()  # Extracting the interface name
-                    break
+            properties = await self.get_all_properties(path, NM_ACCESS_POINT_INTERFACE)
+        except DBusError as e:
+            self.logger.debug(f"Active access point {path} not readable: {e}")
+            return
+        if self.active_access_point != path:
+            # Superseded while reading
+            return
+        self.set_link(
+            bytes(properties.get("Ssid", b"")).decode("utf-8", errors="replace"),
+            properties.get("HwAddress", ""),
+            int(properties.get("Frequency", 0)),
+            int(properties.get("Strength", 0)),
+        )
 
-            if interface is None:
-                # return "No active wireless interface found."
-                return ""
+    async def watch_active_access_point(
+        self, device_object: ProxyObject
+    ) -> Callable[[], None]:
+        properties = device_object.get_interface(PROPERTIES_INTERFACE)
 
-            # Fetching the SSID using the identified wireless interface
-            result = subprocess.run(
-                ["iw", "dev", interface, "link"], capture_output=True, text=True
-            )
-            for line in result.stdout.splitlines():
-                if "SSID" in line:
-                    return line.split("SSID:")[1].strip()  # Extracting the SSID
+        def on_properties_changed(
+            interface: str, changed: Dict[str, Any], _: List[str]
+        ) -> None:
+            if interface == NM_WIRELESS_INTERFACE and "ActiveAccessPoint" in changed:
+                asyncio.create_task(
+                    self.update_active_access_point(
+                        device_object.path, changed["ActiveAccessPoint"].value
+                    )
+                )
+
+        properties.on_properties_changed(on_properties_changed)  # type: ignore
+        path = await self.get_property(
+            device_object.path, NM_WIRELESS_INTERFACE, "ActiveAccessPoint"
+        )
+        await self.update_active_access_point(device_object.path, path)
+        return lambda: properties.off_properties_changed(  # type: ignore
+            on_properties_changed
+        )
+
+    async def get_current_ssid(self) -> str:
+        self.logger.debug("Getting current SSID")
 
+        # By device type, USB adapters are named wlx... rather than wlan0
+        if not self.is_device_type_connected("wlan"):
+            await self.refresh_device_states()
+        interface = next(iter(sorted(self.connected_devices.get("wlan", ()))), None)
+
+        if interface is None:
+            # return "No active wireless interface found."
             return ""
-        except subprocess.CalledProcessError as e:
-            return f"An error occurred: {str(e)}"
+
+        # Fetching the SSID using the identified wireless interface
+        result = await self.commands.run("iw", "dev", interface, "link", timeout=5.0)
+        for line in result.stdout.decode(errors="replace").splitlines():
+            if "SSID" in line:
+                return line.split("SSID:")[1].strip()  # Extracting the SSID
+
+        return ""
 
     async def scan_wifi_networks(self) -> None:
+        # Scan through the NetworkManager D-Bus API, nmcli is the fallback
+        try:
+            scanned = await self.scan_wifi_networks_dbus()
+            if not scanned:
+                self.logger.info("No wireless device on D-Bus, scanning with nmcli.")
+        except Exception as e:
+            scanned = False
+            self.logger.warning(f"D-Bus scan failed, scanning with nmcli: {e}")
+        if not scanned:
+            await self.scan_wifi_networks_nmcli()
+        self.complete_generation()
+        # Explicit scans count too, the scheduler waits a full interval after them
+        self.last_scan = time.monotonic()
+        self.last_scan_time = time.time()
+        self.mark_fresh("scan")
+
+    def set_clients_connected(self, connected: bool) -> None:
+        if connected != self.clients_connected:
+            self.clients_connected = connected
+            self.idle_scans = 0
+            # Reschedule, a new central gets fresh results sooner
+            self.scan_wakeup.set()
+
+    def scan_interval(self) -> float:
+        if self.wifi_status == NetworkStatus.CONNECTED:
+            return self.connected_scan_interval
+        if self.clients_connected:
+            return self.active_scan_interval
+        return min(
+            self.active_scan_interval * 2**self.idle_scans, self.idle_scan_interval
+        )
+
+    def expire_scan_results(self) -> None:
+        expired = set(self.scan_results.expire(self.scan_result_ttl))
+        if expired:
+            self.logger.debug(f"{len(expired)} access points aged out")
+            for path, bssid in list(self.access_points.items()):
+                if bssid in expired:
+                    del self.access_points[path]
+                    self.access_point_devices.pop(path, None)
+            self.publish_access_points()
+            self.complete_generation()
+
+    async def schedule_scans(self, scan: Callable[[], Awaitable[Any]]) -> None:
+        # Keeps the WiFi list warm so reads never wait on a scan
+        while True:
+            self.expire_scan_results()
+            delay = self.last_scan + self.scan_interval() - time.monotonic()
+            if delay > 0:
+                self.scan_wakeup.clear()
+                try:
+                    await asyncio.wait_for(
+                        self.scan_wakeup.wait(), min(delay, self.scan_result_ttl)
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            if self.wifi_status == NetworkStatus.CONNECTING:
+                # Scanning would slow down the connection attempt
+                self.last_scan = time.monotonic()
+                continue
+            self.logger.debug(f"Background scan, interval {self.scan_interval()}s")
+            try:
+                await scan()
+            except Exception as e:
+                self.logger.error(f"Background scan failed: {e}")
+            self.last_scan = time.monotonic()
+            if not self.clients_connected:
+                self.idle_scans += 1
+
+    async def get_wireless_devices(self) -> List[ProxyObject]:
+        if self.devices_listed:
+            # The monitor already knows every device and its type
+            return [
+                device.device_object
+                for device in self.monitored_devices.values()
+                if device.device_type == "wlan"
+            ]
+        nm_interface = await self.system_bus.get_interface(
+            NM_SERVICE, NM_PATH, NM_INTERFACE
+        )
+        devices = await nm_interface.call_get_devices()  # type: ignore
+
+        wireless_devices = []
+        for device_path in devices:
+            device_type = await self.get_property(
+                device_path, NM_DEVICE_INTERFACE, "DeviceType"
+            )
+            if device_type == NM_DEVICE_TYPE_WIFI:
+                wireless_devices.append(
+                    await self.system_bus.get_proxy_object(NM_SERVICE, device_path)
+                )
+        return wireless_devices
+
+    async def get_property(self, path: str, interface: str, name: str) -> Any:
+        return await self.system_bus.get_property(NM_SERVICE, path, interface, name)
+
+    async def get_all_properties(self, path: str, interface: str) -> Dict[str, Any]:
+        return await self.system_bus.get_all_properties(NM_SERVICE, path, interface)
+
+    async def update_access_point(self, path: str, device: str) -> None:
+        try:
+            properties = await self.get_all_properties(path, NM_ACCESS_POINT_INTERFACE)
+        except DBusError as e:
+            # The access point can disappear before it is read
+            self.logger.debug(f"Access point {path} not readable: {e}")
+            return
+        ssid = bytes(properties.get("Ssid", b"")).decode("utf-8", errors="replace")
+        bssid = properties.get("HwAddress", "") or path
+        frequency = int(properties.get("Frequency", 0))
+        strength = int(properties.get("Strength", 0))
+        previous = self.access_points.get(path)
+        if previous is not None and previous != bssid:
+            self.scan_results.remove(previous)
+        self.access_points[path] = bssid
+        self.access_point_devices[path] = device
+        self.scan_results.add(
+            bssid,
+            ssid,
+            frequency,
+            strength,
+            security_of(
+                int(properties.get("Flags", 0)),
+                int(properties.get("WpaFlags", 0)),
+                int(properties.get("RsnFlags", 0)),
+            ),
+        )
+        if path == self.active_access_point:
+            # Scans refresh the signal of the current link as well
+            self.set_link(ssid, bssid, frequency, strength)
+
+    def remove_access_point(self, path: str) -> bool:
+        bssid = self.access_points.pop(path, None)
+        self.access_point_devices.pop(path, None)
+        if bssid is None:
+            return False
+        self.scan_results.remove(bssid)
+        return True
+
+    def publish_access_points(self) -> None:
+        networks_dict = self.scan_results.networks()
+        if networks_dict != dict(self.networks):
+            self.set_networks(networks_dict)
+            self.on_change_network("networks", str(len(self.networks)))
+
+    def watch_access_points(self, wireless: ProxyInterface) -> None:
+        if wireless.path in self.watched_wireless:
+            return
+
+        async def access_point_added(path: str) -> None:
+            await self.update_access_point(path, wireless.path)
+            self.publish_access_points()
+
+        def on_access_point_added(path: str) -> None:
+            asyncio.create_task(access_point_added(path))
+
+        def on_access_point_removed(path: str) -> None:
+            if self.remove_access_point(path):
+                self.publish_access_points()
+
+        wireless.on_access_point_added(on_access_point_added)  # type: ignore
+        wireless.on_access_point_removed(on_access_point_removed)  # type: ignore
+
+        def unwatch() -> None:
+            wireless.off_access_point_added(on_access_point_added)  # type: ignore
+            wireless.off_access_point_removed(on_access_point_removed)  # type: ignore
+
+        self.watched_wireless[wireless.path] = unwatch
+
+    async def scan_wifi_networks_dbus(self) -> bool:
+        wireless_devices = await self.get_wireless_devices()
+        if not wireless_devices:
+            return False
+
+        self.logger.debug("Scanning networks over D-Bus")
+        self.scan_status = ScanStatus.SCANNING
+
+        for device_object in wireless_devices:
+            wireless = device_object.get_interface(NM_WIRELESS_INTERFACE)
+            properties = device_object.get_interface(PROPERTIES_INTERFACE)
+            # Results arrive through AccessPointAdded while the scan runs
+            self.watch_access_points(wireless)
+
+            scanned = asyncio.Event()
+
+            def on_properties_changed(
+                interface: str, changed: Dict[str, Any], _: List[str]
+            ) -> None:
+                if interface == NM_WIRELESS_INTERFACE and "LastScan" in changed:
+                    scanned.set()
+
+            properties.on_properties_changed(on_properties_changed)  # type: ignore
+            try:
+                await wireless.call_request_scan({})  # type: ignore
+                await asyncio.wait_for(scanned.wait(), self.scan_timeout)
+            except DBusError as e:
+                # Usually a scan already running or one that just finished
+                self.logger.debug(f"RequestScan refused: {e}")
+            except asyncio.TimeoutError:
+                self.logger.warning("Timed out waiting for the scan to finish.")
+            finally:
+                properties.off_properties_changed(on_properties_changed)  # type: ignore
+
+            access_point_paths = await wireless.call_get_all_access_points()  # type: ignore
+            current = set(access_point_paths)
+            for path, device in list(self.access_point_devices.items()):
+                if device == wireless.path and path not in current:
+                    self.remove_access_point(path)
+            await asyncio.gather(
+                *(
+                    self.update_access_point(path, wireless.path)
+                    for path in access_point_paths
+                )
+            )
+
+        self.publish_access_points()
+        self.scan_status = ScanStatus.COMPLETE
+        self.logger.debug("Sorted Networks:")
+        for essid, signal in self.networks:
+            self.logger.debug(f"ESSID: {essid}, Signal: {signal}")
+        return True
+
+    async def scan_wifi_networks_nmcli(self) -> None:
         retries = 5
         for attempt in range(retries):
             self.logger.debug("attempt")
@@ -137,47 +653,44 @@ class NetworkManagerService:
                 # self.logger.debug(f"Rescan stdout: {rescan_stdout.decode('utf-8')}")
                 # self.logger.debug(f"Rescan stderr: {rescan_stderr.decode('utf-8')}")
 
-                process = await asyncio.create_subprocess_exec(
+                process = await self.commands.run(
                     "sudo",
                     "nmcli",
                     "-t",
                     "-f",
-                    "ssid,signal",
+                    "ssid,bssid,freq,signal,security",
                     "device",
                     "wifi",
                     "list",
                     "--rescan",
                     "yes",
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE,
                 )
-                # stdout, stderr = await process.communicate()
-                stdout, stderr = await process.communicate()
+                stdout, stderr = process.stdout, process.stderr
                 self.logger.debug(f"Scan stdout: {stdout.decode('utf-8')}")
                 self.logger.debug(f"Scan stderr: {stderr.decode('utf-8')}")
                 if process.returncode == 0 and stdout != b"":
                     stdout_text = stdout.decode("utf-8")
-                    networks_dict: Dict[str, int] = (
-                        {}
-                    )  # Local dictionary to hold the network data
+                    self.scan_results.clear()
+                    self.access_points.clear()
+                    self.access_point_devices.clear()
 
                     for line in stdout_text.splitlines():
-                        fields = line.split(":")
-                        if len(fields) == 2:
-                            ssid, signal_str = fields
-                            if ssid != "":
-                                signal = int(signal_str)
-                                if (
-                                    ssid not in networks_dict
-                                    or networks_dict[ssid] < signal
-                                ):
-                                    networks_dict[ssid] = signal
-
-                    self.networks = sorted(
-                        networks_dict.items(),
-                        key=lambda item: item[1],
-                        reverse=True,
-                    )
+                        # Terse output escapes colons inside values as \:
+                        fields = [
+                            field.replace("\\:", ":")
+                            for field in TERSE_SEPARATOR.split(line)
+                        ]
+                        if len(fields) == 5:
+                            ssid, bssid, frequency, signal, security = fields
+                            self.scan_results.add(
+                                bssid,
+                                ssid,
+                                int(frequency.split(" ")[0] or 0),
+                                int(signal),
+                                "" if security == "--" else security,
+                            )
+
+                    self.set_networks(self.scan_results.networks())
                     self.scan_status = ScanStatus.COMPLETE
                     self.logger.debug("Sorted Networks:")
                     for essid, signal in self.networks:
@@ -200,69 +713,230 @@ class NetworkManagerService:
                 self.logger.error(f"Exception while scanning networks: {str(e)}")
                 await asyncio.sleep(5)
 
+    # Number of scan generations removed networks are remembered for
+    REMOVED_NETWORK_GENERATIONS = 16
+
+    def set_networks(self, networks_dict: Dict[str, int]) -> None:
+        generation = self.scan_generation + 1
+        self.generation_pending = True
+        previous = dict(self.networks)
+
+        for ssid, signal in networks_dict.items():
+            if previous.get(ssid) != signal:
+                self.network_generations[ssid] = generation
+            self.removed_networks.pop(ssid, None)
+        for ssid in previous.keys() - networks_dict.keys():
+            self.network_generations.pop(ssid, None)
+            self.removed_networks[ssid] = generation
+
+        self.networks = sorted(
+            networks_dict.items(),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+
+    def complete_generation(self) -> None:
+        # Called when a scan or batch of changes is complete, however many
+        # access point signals it took
+        if not self.generation_pending:
+            return
+        self.generation_pending = False
+        self.scan_generation += 1
+        oldest = self.scan_generation - self.REMOVED_NETWORK_GENERATIONS
+        for ssid, removed in list(self.removed_networks.items()):
+            if removed <= oldest:
+                del self.removed_networks[ssid]
+
+    def get_wifi_page_json(
+        self, offset: int = 0, limit: int | None = None, since: int | None = None
+    ) -> str:
+        # Changes since an old generation can not be computed once removals are
+        # forgotten, the full list is sent instead
+        oldest = self.scan_generation - self.REMOVED_NETWORK_GENERATIONS
+        full = since is None or since < oldest
+        networks = self.networks
+        removed: List[str] = []
+        if since is not None and not full:
+            networks = [
+                (ssid, signal)
+                for ssid, signal in networks
+                if self.network_generations.get(ssid, 0) > since
+            ]
+            removed = [
+                ssid
+                for ssid, generation in self.removed_networks.items()
+                if generation > since
+            ]
+
+        end = None if limit is None else offset + limit
+        page = {
+            "generation": self.scan_generation,
+            "full": full,
+            "total": len(networks),
+            "offset": offset,
+            "networks": [
+                self.network_entry(ssid, signal)
+                for ssid, signal in networks[offset:end]
+            ],
+            "removed": removed,
+        }
+        return json.dumps(page)
+
+    def network_entry(self, ssid: str, signal: int) -> Dict[str, Any]:
+        entry: Dict[str, Any] = {"ssid": ssid, "signal": signal}
+        # Details of the strongest access point, so the app can pick the band
+        # or skip open networks without scanning again
+        record = self.scan_results.best.get(ssid)
+        if record is not None:
+            entry["bssid"] = record.bssid
+            entry["freq"] = record.frequency
+            entry["security"] = record.security
+        if ssid in self.saved_connections:
+            entry["known"] = True
+        return entry
+
     def get_wifi_json(self) -> str:
         # Return the list of all networks as a JSON array
         networks_list = [
-            {"ssid": ssid, "signal": signal} for ssid, signal in self.networks
+            self.network_entry(ssid, signal) for ssid, signal in self.networks
         ]
         return json.dumps(networks_list)
 
-    def is_wifi_connected(self) -> bool:
-        self.logger.debug("Checking connection status in function.")
+    def set_device_state(self, interface: str, device_type: str, state: int) -> None:
+        self.device_states[interface] = (device_type, state)
+        connected = self.connected_devices.setdefault(device_type, set())
+        if state == NM_DEVICE_STATE_ACTIVATED:
+            connected.add(interface)
+        else:
+            connected.discard(interface)
 
-        try:
-            process = subprocess.run(
-                ["nmcli", "-t", "-f", "DEVICE,STATE", "dev", "status"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                check=True,
+    async def refresh_device_states(self) -> bool:
+        # Fallback for when the D-Bus monitor has not loaded the table yet, one
+        # nmcli call fills it for both wifi and ethernet checks
+        process = await self.commands.run(
+            "nmcli", "-t", "-f", "DEVICE,TYPE,STATE", "dev", "status", timeout=10.0
+        )
+        if process.returncode != 0:
+            self.logger.error(
+                f"Failed to read device states: {process.stderr.decode().strip()}"
             )
-        except subprocess.CalledProcessError as e:
-            self.process_returncode(e.stderr)
             return False
 
         output = process.stdout.decode().strip()
         for line in output.split("\n"):
-            device, state = line.split(":")
-            # Check if the device is a wlan interface and if its state is connected
-            if "wlan" in device and state == "connected":
-                self.wifi_status = NetworkStatus.CONNECTED
-                self.logger.info("Successfully connected to the WiFi network.")
-                return True
+            fields = TERSE_SEPARATOR.split(line)
+            if len(fields) != 3:
+                continue
+            device, nmcli_type, state = fields
+            self.logger.debug(f"Device: {device}, Type: {nmcli_type}, State: {state}")
+            device_type = NMCLI_DEVICE_TYPES.get(nmcli_type, "")
+            self.set_device_state(
+                device, device_type, NMCLI_DEVICE_STATES.get(state.split(" ")[0], 0)
+            )
+        return True
+
+    def is_device_type_connected(self, device_type: str) -> bool:
+        return bool(self.connected_devices.get(device_type))
+
+    async def check_connections(self) -> None:
+        await self.is_wifi_connected()
+        await self.is_ethernet_connected()
+        self.mark_fresh("link")
+
+    def mark_fresh(self, part: str) -> None:
+        if part not in self.stale_parts:
+            return
+        self.stale_parts.discard(part)
+        if not self.stale_parts:
+            self.stale = False
+            self.on_change_network("stale", "False")
+
+    def export_state(self) -> Dict[str, Any]:
+        # Scan times are monotonic, they are stored as wall clock times
+        offset = time.time() - time.monotonic()
+        return {
+            "wlan": self.wifi_status,
+            "eth": self.ethernet_status,
+            "ssid": self.current_ssid,
+            "bssid": self.current_bssid,
+            "freq": self.current_frequency,
+            "signal": self.current_signal,
+            "error": self.error,
+            "last_scan": self.last_scan_time,
+            "access_points": [
+                [
+                    record.bssid,
+                    record.ssid,
+                    record.frequency,
+                    record.signal,
+                    record.security,
+                    round(record.last_seen + offset),
+                ]
+                for record in self.scan_results.records.values()
+            ],
+        }
+
+    def restore_state(self, state: Dict[str, Any]) -> None:
+        # Runs before the callbacks are of use, so no change is reported
+        offset = time.time() - time.monotonic()
+        for bssid, ssid, frequency, signal, security, seen in state.get(
+            "access_points", []
+        ):
+            self.scan_results.add(
+                bssid, ssid, frequency, signal, security, now=seen - offset
+            )
+        self.scan_results.expire(self.scan_result_ttl)
+        self.set_networks(self.scan_results.networks())
+        self.complete_generation()
+        if self.networks:
+            self._scan_status = ScanStatus.COMPLETE
+        self.last_scan_time = state.get("last_scan")
+
+        # A connection attempt does not survive a restart
+        wifi_status = state.get("wlan", NetworkStatus.NOT_CONNECTED)
+        if wifi_status == NetworkStatus.CONNECTING:
+            wifi_status = NetworkStatus.NOT_CONNECTED
+        self._wifi_status = wifi_status
+        self._ethernet_status = state.get("eth", NetworkStatus.NOT_CONNECTED)
+        self._current_ssid = state.get("ssid", "")
+        self.current_bssid = state.get("bssid", "")
+        self.current_frequency = state.get("freq", 0)
+        self.current_signal = state.get("signal", 0)
+        self._error = state.get("error")
+        self.stale = True
+        self.stale_parts = {"link", "scan"}
+
+    async def is_wifi_connected(self) -> bool:
+        self.logger.debug("Checking connection status in function.")
+
+        if not self.device_states and not await self.refresh_device_states():
+            return False
+
+        if self.is_device_type_connected("wlan"):
+            self.wifi_status = NetworkStatus.CONNECTED
+            self.logger.info("Successfully connected to the WiFi network.")
+            return True
 
         self.logger.debug("Disconnected from the WiFi network.")
         self.wifi_status = NetworkStatus.NOT_CONNECTED
         return False
 
-    def is_ethernet_connected(self) -> bool:
+    async def is_ethernet_connected(self) -> bool:
         self.logger.debug("Checking Ethernet connection status in function.")
 
-        try:
-            process = subprocess.run(
-                ["nmcli", "-t", "-f", "DEVICE,STATE", "dev", "status"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                check=True,
-            )
-        except subprocess.CalledProcessError as e:
-            self.process_returncode(e.stderr)
+        if not self.device_states and not await self.refresh_device_states():
             return False
 
-        output = process.stdout.decode().strip()
-        for line in output.split("\n"):
-            device, state = line.split(":")
-            # Check if the device is an Ethernet interface and if its state is connected
-            self.logger.debug(f"Device: {device}, State: {state}")
-            if "eth" in device and state == "connected":
-                self.ethernet_status = NetworkStatus.CONNECTED
-                self.logger.info("Successfully connected to the Ethernet network.")
-                return True
+        if self.is_device_type_connected("eth"):
+            self.ethernet_status = NetworkStatus.CONNECTED
+            self.logger.info("Successfully connected to the Ethernet network.")
+            return True
 
         self.logger.debug("Disconnected from the Ethernet network.")
         self.ethernet_status = NetworkStatus.NOT_CONNECTED
         return False
 
-    def process_returncode(self, stderr: bytes) -> None:
+    async def process_returncode(self, stderr: bytes) -> None:
         error_message = stderr.decode().strip()
         if "No network with SSID" in error_message:
             self.logger.debug("SSID does not exist.")
@@ -276,49 +950,252 @@ class NetworkManagerService:
             self.logger.debug(f"Failed to connect to the WiFi network: {error_message}")
             self.wifi_status = NetworkStatus.FAILED_START
             self.error = NetworkStatus.FAILED_START
-            self.restart_network_manager()
-        self.is_wifi_connected()
-        self.is_ethernet_connected()
+            await self.restart_network_manager()
+        await self.check_connections()
 
-    def restart_network_manager(self) -> None:
-        try:
-            subprocess.run(
-                ["sudo", "systemctl", "restart", "NetworkManager"],
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
+    async def restart_network_manager(self) -> None:
+        if self.restart_lock.locked():
+            self.logger.info("NetworkManager is already restarting.")
+            return
+        async with self.restart_lock:
+            process = await self.commands.run(
+                "sudo",
+                "systemctl",
+                "restart",
+                "NetworkManager",
+                timeout=self.restart_timeout,
             )
+        if process.returncode == 0:
             self.logger.info("NetworkManager restarted successfully.")
-        except subprocess.CalledProcessError as e:
+        else:
             self.logger.error(
-                f"Failed to restart NetworkManager: {e.stderr.decode().strip()}"
+                f"Failed to restart NetworkManager: {process.stderr.decode().strip()}"
             )
 
     async def configure_wifi_async(self, ssid: str | None, password: str) -> bool:
-        if ssid:
-            self.wifi_status = NetworkStatus.CONNECTING
-            self.desired_ssid = ssid
-            process = await asyncio.create_subprocess_exec(
-                "nmcli",
-                "dev",
-                "wifi",
-                "connect",
-                ssid,
-                "password",
-                password,
-                "hidden",
-                "yes",
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
+        if not ssid:
+            self.logger.debug("SSID is None")
+            return False
+
+        self.wifi_status = NetworkStatus.CONNECTING
+        self.desired_ssid = ssid
+        # Activate through the NetworkManager D-Bus API, nmcli is the fallback
+        try:
+            activated = await self.activate_wifi_dbus(ssid, password)
+            if activated is not None:
+                return activated
+            self.logger.info("No wireless device on D-Bus, connecting with nmcli.")
+        except Exception as e:
+            self.logger.warning(f"D-Bus activation failed, connecting with nmcli: {e}")
+        return await self.configure_wifi_nmcli(ssid, password)
+
+    async def monitor_saved_connections(self) -> None:
+        async with self.saved_connections_lock:
+            if self.saved_connections_loaded:
+                return
+            settings = await self.system_bus.get_interface(
+                NM_SERVICE, NM_SETTINGS_PATH, NM_SETTINGS_INTERFACE
             )
 
-            _, stderr = await process.communicate()
+            # Subscribe before listing so no profile change is lost in between
+            def on_new_connection(path: str) -> None:
+                asyncio.create_task(self.index_connection(path))
+
+            settings.on_new_connection(on_new_connection)  # type: ignore
+            settings.on_connection_removed(self.unindex_connection)  # type: ignore
 
-            if process.returncode != 0:
-                self.process_returncode(stderr)
-                return False
+            for path in await settings.call_list_connections():  # type: ignore
+                await self.index_connection(path)
+            self.saved_connections_loaded = True
+        self.logger.debug(f"{len(self.saved_connections)} saved WiFi connections")
+
+    async def index_connection(self, path: str) -> None:
+        try:
+            connection = await self.system_bus.get_interface(
+                NM_SERVICE, path, NM_CONNECTION_INTERFACE
+            )
+            values = await connection.call_get_settings()  # type: ignore
+        except DBusError as e:
+            # Removed again before it could be read
+            self.logger.debug(f"Connection {path} not readable: {e}")
+            return
+        wireless = values.get("802-11-wireless")
+        if wireless is None or "ssid" not in wireless:
+            return
+        ssid = bytes(wireless["ssid"].value).decode("utf-8", errors="replace")
+        self.saved_connections[ssid] = path
+        self.saved_ssids[path] = ssid
+        self.touch_network(ssid)
+
+    def unindex_connection(self, path: str) -> None:
+        self.system_bus.invalidate(NM_SERVICE, path)
+        ssid = self.saved_ssids.pop(path, None)
+        if ssid is None or self.saved_connections.get(ssid) != path:
+            return
+        del self.saved_connections[ssid]
+        # Another profile for the same SSID takes over
+        for other_path, other_ssid in self.saved_ssids.items():
+            if other_ssid == ssid:
+                self.saved_connections[ssid] = other_path
+        self.touch_network(ssid)
+
+    def touch_network(self, ssid: str) -> None:
+        # The known flag of a listed network changed, so list it as changed
+        if ssid in dict(self.networks):
+            self.network_generations[ssid] = self.scan_generation + 1
+            self.generation_pending = True
+            self.on_change_network("networks", str(len(self.networks)))
+
+    async def find_connection(self, ssid: str) -> Optional[str]:
+        # Saved WiFi profile for the SSID, so connecting again does not add one
+        await self.monitor_saved_connections()
+        return self.saved_connections.get(ssid)
+
+    async def saved_password_matches(self, connection_path: str, password: str) -> bool:
+        connection = await self.system_bus.get_interface(
+            NM_SERVICE, connection_path, NM_CONNECTION_INTERFACE
+        )
+        try:
+            secrets = await connection.call_get_secrets(  # type: ignore
+                "802-11-wireless-security"
+            )
+        except DBusError as e:
+            self.logger.debug(f"Secrets of {connection_path} not readable: {e}")
+            return False
+        psk = secrets.get("802-11-wireless-security", {}).get("psk")
+        return psk is not None and psk.value == password
+
+    async def activate_wifi_dbus(self, ssid: str, password: str) -> Optional[bool]:
+        wireless_devices = await self.get_wireless_devices()
+        if not wireless_devices:
+            return None
+        device_path = wireless_devices[0].path
+        nm_interface = await self.system_bus.get_interface(
+            NM_SERVICE, NM_PATH, NM_INTERFACE
+        )
+
+        security = {
+            "key-mgmt": Variant("s", "wpa-psk"),
+            "psk": Variant("s", password),
+        }
+        connection_path = await self.find_connection(ssid)
+        if connection_path is not None:
+            self.logger.debug(f"Activating saved connection for {ssid}")
+            # An omitted or unchanged password activates the profile as it is
+            if password and not await self.saved_password_matches(
+                connection_path, password
+            ):
+                connection = await self.system_bus.get_interface(
+                    NM_SERVICE, connection_path, NM_CONNECTION_INTERFACE
+                )
+                values = await connection.call_get_settings()  # type: ignore
+                values["802-11-wireless-security"] = security
+                await connection.call_update(values)  # type: ignore
+            active_path = await nm_interface.call_activate_connection(  # type: ignore
+                connection_path, device_path, "/"
+            )
         else:
-            self.logger.debug("SSID is None")
+            self.logger.debug(f"Adding connection for {ssid}")
+            values = {
+                "connection": {
+                    "id": Variant("s", ssid),
+                    "type": Variant("s", "802-11-wireless"),
+                },
+                "802-11-wireless": {
+                    "ssid": Variant("ay", ssid.encode()),
+                    "hidden": Variant("b", True),
+                },
+            }
+            if password:
+                values["802-11-wireless-security"] = security
+            _, active_path = await nm_interface.call_add_and_activate_connection(  # type: ignore
+                values, device_path, "/"
+            )
+        return await self.wait_for_activation(ssid, active_path)
+
+    async def wait_for_activation(self, ssid: str, active_path: str) -> bool:
+        # Intermediate stages reach the status characteristic through the
+        # device StateChanged handler while this waits for the outcome
+        active = await self.system_bus.get_interface(
+            NM_SERVICE, active_path, NM_ACTIVE_CONNECTION_INTERFACE
+        )
+        loop = asyncio.get_running_loop()
+        outcome: asyncio.Future = loop.create_future()
+
+        def on_state_changed(state: int, reason: int) -> None:
+            if outcome.done():
+                return
+            if state in (
+                NM_ACTIVE_CONNECTION_STATE_ACTIVATED,
+                NM_ACTIVE_CONNECTION_STATE_DEACTIVATED,
+            ):
+                outcome.set_result((state, reason))
+
+        active.on_state_changed(on_state_changed)  # type: ignore
+        try:
+            # It may have settled before the handler was attached
+            state = await self.get_property(
+                active_path, NM_ACTIVE_CONNECTION_INTERFACE, "State"
+            )
+            on_state_changed(state, 0)
+            state, reason = await asyncio.wait_for(outcome, self.connect_timeout)
+        except asyncio.TimeoutError:
+            self.logger.warning(f"Connecting to {ssid} timed out.")
+            await self.deactivate_connection(active_path)
+            self.wifi_status = NetworkStatus.CONNECT_TIMEOUT
+            self.error = NetworkStatus.CONNECT_TIMEOUT
+            return False
+        except asyncio.CancelledError:
+            # Superseded by a newer connect, do not leave the attempt running
+            self.logger.info(f"Connection attempt to {ssid} cancelled.")
+            await self.deactivate_connection(active_path)
+            raise
+        except DBusError:
+            # The active connection is gone, it failed before it was read
+            state, reason = NM_ACTIVE_CONNECTION_STATE_DEACTIVATED, 0
+        finally:
+            active.off_state_changed(on_state_changed)  # type: ignore
+            self.system_bus.invalidate(NM_SERVICE, active_path)
+
+        if state == NM_ACTIVE_CONNECTION_STATE_ACTIVATED:
+            self.logger.info(f"Connected to {ssid}.")
+            return True
+        if reason in NM_ACTIVE_CONNECTION_REASONS_BAD_SECRETS:
+            self.logger.debug("Bad password or authentication failure.")
+            self.wifi_status = NetworkStatus.INVALID_PASSWORD
+            self.error = NetworkStatus.INVALID_PASSWORD
+        else:
+            self.logger.debug(f"Connecting to {ssid} failed with reason {reason}.")
+            self.wifi_status = NetworkStatus.FAILED_START
+            self.error = NetworkStatus.FAILED_START
+        return False
+
+    async def deactivate_connection(self, active_path: str) -> None:
+        try:
+            nm_interface = await self.system_bus.get_interface(
+                NM_SERVICE, NM_PATH, NM_INTERFACE
+            )
+            await nm_interface.call_deactivate_connection(active_path)  # type: ignore
+        except DBusError as e:
+            self.logger.debug(f"Could not deactivate {active_path}: {e}")
+
+    async def configure_wifi_nmcli(self, ssid: str, password: str) -> bool:
+        # A newer connect cancels this one, which kills nmcli
+        process = await self.commands.run(
+            "nmcli",
+            "dev",
+            "wifi",
+            "connect",
+            ssid,
+            "password",
+            password,
+            "hidden",
+            "yes",
+            timeout=self.connect_timeout,
+        )
+
+        if process.returncode != 0:
+            await self.process_returncode(process.stderr)
             return False
 
         self.logger.debug("Connection attempt started.")
@@ -328,6 +1205,15 @@ class NetworkManagerService:
         self, device_type: str, device_interface: str
     ) -> Callable[[int, int, int], None]:
         def state_changed_handler(state: int, _: int, reason: int) -> None:
+            self.set_device_state(device_interface, device_type, state)
+            if device_type == "wlan":
+                self.connection_stage = NM_DEVICE_STAGES.get(state, "")
+                if (
+                    state == NM_DEVICE_STATE_ACTIVATED
+                    and len(self.active_access_points) > 1
+                ):
+                    # The link follows the activated one of several adapters
+                    asyncio.create_task(self.update_link())
             status = None
             if state == 100:
                 self.logger.debug(
@@ -365,51 +1251,105 @@ class NetworkManagerService:
                 )
                 self.error = NetworkStatus.INVALID_PASSWORD
             if status:
-                if "wlan" in device_interface:
+                if device_type == "wlan":
                     self.wifi_status = status
-                elif "eth" in device_interface:
+                elif device_type == "eth":
                     self.ethernet_status = status
 
         return state_changed_handler
 
     async def monitor_wifi_status(self) -> None:
-        bus = await MessageBus(bus_type=BusType.SYSTEM).connect()
+        nm_interface = await self.system_bus.get_interface(
+            NM_SERVICE, NM_PATH, NM_INTERFACE
+        )
+
+        # Subscribe before listing so hot-plugged adapters are not missed
+        def on_device_added(device_path: str) -> None:
+            asyncio.create_task(self.attach_device(device_path))
+
+        nm_interface.on_device_added(on_device_added)  # type: ignore
+        nm_interface.on_device_removed(self.detach_device)  # type: ignore
 
-        introspection = await bus.introspect(
-            "org.freedesktop.NetworkManager", "/org/freedesktop/NetworkManager"
+        devices = await nm_interface.call_get_devices()  # type: ignore
+        for device_path in devices:
+            await self.attach_device(device_path)
+        self.devices_listed = True
+
+    async def attach_device(self, device_path: str) -> None:
+        if (
+            device_path in self.monitored_devices
+            or device_path in self.attaching_devices
+        ):
+            return
+        self.attaching_devices.add(device_path)
+        try:
+            await self.attach_device_handlers(device_path)
+            if device_path not in self.attaching_devices:
+                # Removed while it was being attached
+                self.detach_device(device_path)
+        except DBusError as e:
+            # Removed again before it could be read
+            self.logger.debug(f"Device {device_path} not readable: {e}")
+            self.system_bus.invalidate(NM_SERVICE, device_path)
+        finally:
+            self.attaching_devices.discard(device_path)
+
+    async def attach_device_handlers(self, device_path: str) -> None:
+        device_object = await self.system_bus.get_proxy_object(NM_SERVICE, device_path)
+        device_interface = device_object.get_interface(
+            "org.freedesktop.NetworkManager.Device"
         )
-        proxy_object = bus.get_proxy_object(
-            "org.freedesktop.NetworkManager",
-            "/org/freedesktop/NetworkManager",
-            introspection,
+
+        device_type_variant = await device_interface.get_device_type()  # type: ignore
+        device_type = (
+            "eth"
+            if device_type_variant == 1
+            else "wlan" if device_type_variant == 2 else None
+        )
+        if not device_type:
+            return
+        device_interface_name = await device_interface.get_interface()  # type: ignore
+        self.logger.debug(f"Monitoring {device_type} device: {device_interface_name}")
+        device = MonitoredDevice(
+            device_path, device_object, device_interface_name, device_type
         )
-        nm_interface = proxy_object.get_interface("org.freedesktop.NetworkManager")
-        devices = await nm_interface.call_get_devices()  # type: ignore
 
-        for device_path in devices:
-            introspection = await bus.introspect(
-                "org.freedesktop.NetworkManager", device_path
-            )
-            device_object = bus.get_proxy_object(
-                "org.freedesktop.NetworkManager", device_path, introspection
-            )
-            device_interface = device_object.get_interface(
-                "org.freedesktop.NetworkManager.Device"
-            )
+        state = await device_interface.get_state()  # type: ignore
+        self.set_device_state(device_interface_name, device_type, state)
 
-            device_type_variant = await device_interface.get_device_type()  # type: ignore
-            device_type = (
-                "eth"
-                if device_type_variant == 1
-                else "wlan" if device_type_variant == 2 else None
+        properties_changed_handler = self.create_state_changed_handler(
+            device_type, device_interface_name
+        )
+        device_interface.on_state_changed(properties_changed_handler)  # type: ignore
+        device.detach.append(
+            lambda: device_interface.off_state_changed(  # type: ignore
+                properties_changed_handler
             )
-            if device_type:
-                device_interface_name = await device_interface.get_interface()  # type: ignore
-                self.logger.debug(
-                    f"Monitoring {device_type} device: {device_interface_name}"
-                )
+        )
+        self.monitored_devices[device_path] = device
+        if device_type == "wlan":
+            device.detach.append(await self.watch_active_access_point(device_object))
 
-                properties_changed_handler = self.create_state_changed_handler(
-                    device_type, device_interface_name
-                )
-                device_interface.on_state_changed(properties_changed_handler)  # type: ignore
+    def detach_device(self, device_path: str) -> None:
+        self.attaching_devices.discard(device_path)
+        device = self.monitored_devices.pop(device_path, None)
+        self.system_bus.invalidate(NM_SERVICE, device_path)
+        if device is None:
+            return
+        self.logger.debug(f"{device.device_type} device {device.name} removed")
+        for detach in device.detach:
+            detach()
+        unwatch = self.watched_wireless.pop(device_path, None)
+        if unwatch is not None:
+            unwatch()
+
+        self.device_states.pop(device.name, None)
+        self.connected_devices.get(device.device_type, set()).discard(device.name)
+        if device.device_type == "wlan":
+            if self.active_access_points.pop(device_path, "/") != "/":
+                # It may have carried the link
+                asyncio.create_task(self.update_link())
+            if not self.is_device_type_connected("wlan"):
+                self.wifi_status = NetworkStatus.NOT_CONNECTED
+        elif not self.is_device_type_connected("eth"):
+            self.ethernet_status = NetworkStatus.NOT_CONNECTED
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Deque, Dict, Tuple
+
+from .ble_framing import OutgoingMessage
+
+
+class NotificationQueue:
+    """Ordered, paced delivery of notification messages per characteristic.
+
+    Each characteristic has its own queue and worker on the event loop, so the
+    chunks of one message are all sent before the next message starts. When the
+    chunk sender reports congestion the worker backs off before retrying. If a
+    queue is full the oldest waiting message is dropped as stale.
+    """
+
+    MAX_RETRIES = 5
+    MIN_BACKOFF = 0.01
+    MAX_BACKOFF = 0.5
+
+    def __init__(
+        self,
+        send_chunk: Callable[[str, bytearray], bool],
+        pacing: float,
+        max_pending: int = 4,
+    ) -> None:
+        self.logger = logging.getLogger(name=__name__)
+        self.send_chunk = send_chunk
+        self.pacing = pacing
+        self.max_pending = max_pending
+        self.queues: Dict[str, Deque[Tuple[OutgoingMessage, int, asyncio.Future]]] = {}
+        self.wakeups: Dict[str, asyncio.Event] = {}
+        self.workers: Dict[str, asyncio.Task] = {}
+        self.dropped = 0
+        self.congested = 0
+
+    def depth(self, characteristic_uuid: str) -> int:
+        return len(self.queues.get(characteristic_uuid, ()))
+
+    def send(
+        self, characteristic_uuid: str, message: OutgoingMessage, chunk_size: int
+    ) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        queue = self.queues.setdefault(characteristic_uuid, deque())
+        if len(queue) >= self.max_pending:
+            _, _, stale = queue.popleft()
+            self.dropped += 1
+            if not stale.done():
+                stale.set_result(False)
+
+        done = loop.create_future()
+        queue.append((message, chunk_size, done))
+        self.wakeups.setdefault(characteristic_uuid, asyncio.Event()).set()
+
+        worker = self.workers.get(characteristic_uuid)
+        if worker is None or worker.done():
+            self.workers[characteristic_uuid] = asyncio.create_task(
+                self.run(characteristic_uuid)
+            )
+        return done
+
+    async def run(self, characteristic_uuid: str) -> None:
+        queue = self.queues[characteristic_uuid]
+        wakeup = self.wakeups[characteristic_uuid]
+        while True:
+            if not queue:
+                wakeup.clear()
+                await wakeup.wait()
+                continue
+
+            message, chunk_size, done = queue.popleft()
+            try:
+                delivered = await self.deliver(characteristic_uuid, message, chunk_size)
+            except Exception as e:
+                self.logger.error(f"Notification on {characteristic_uuid} failed: {e}")
+                delivered = False
+            if not done.done():
+                done.set_result(delivered)
+
+    async def deliver(
+        self, characteristic_uuid: str, message: OutgoingMessage, chunk_size: int
+    ) -> bool:
+        while not message.done:
+            chunk = message.next_chunk(chunk_size)
+            backoff = max(self.pacing, self.MIN_BACKOFF)
+            for _ in range(self.MAX_RETRIES):
+                if self.send_chunk(characteristic_uuid, chunk):
+                    break
+                # BlueZ did not take the value, give the link time to drain
+                self.congested += 1
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.MAX_BACKOFF)
+            else:
+                self.logger.warning(
+                    f"Dropping notification on {characteristic_uuid}, link congested"
+                )
+                return False
+            # Yield to the loop between chunks even without pacing
+            await asyncio.sleep(self.pacing)
+        return True
+
+    def cancel(self) -> None:
+        for worker in self.workers.values():
+            worker.cancel()
+        self.workers.clear()
+        for queue in self.queues.values():
+            for _, _, done in queue:
+                if not done.done():
+                    done.set_result(False)
+            queue.clear()
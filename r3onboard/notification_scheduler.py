@@ -0,0 +1,53 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Set
+
+
+class NotificationScheduler:
+    """Coalesces change notifications per characteristic.
+
+    Changes scheduled within the window are merged into a single send, and the
+    snapshot is only built when the send runs, so it is always the latest one.
+    Changes arriving while a send is in flight trigger exactly one more send.
+    """
+
+    def __init__(self, window: float, send: Callable[[str], Awaitable[None]]) -> None:
+        self.logger = logging.getLogger(name=__name__)
+        self.window = window
+        self.send = send
+        self.pending: Dict[str, asyncio.TimerHandle] = {}
+        self.sending: Dict[str, asyncio.Task] = {}
+        self.dirty: Set[str] = set()
+        self.coalesced = 0
+
+    def schedule(self, key: str) -> None:
+        if key in self.sending:
+            # The snapshot being sent is already stale, send again afterwards
+            self.dirty.add(key)
+            return
+        if key in self.pending:
+            self.coalesced += 1
+            return
+        loop = asyncio.get_running_loop()
+        self.pending[key] = loop.call_later(self.window, self.flush, key)
+
+    def flush(self, key: str) -> None:
+        self.pending.pop(key, None)
+        self.sending[key] = asyncio.create_task(self.run(key))
+
+    async def run(self, key: str) -> None:
+        try:
+            await self.send(key)
+        except Exception as e:
+            self.logger.error(f"Failed to send notification for {key}: {e}")
+        finally:
+            self.sending.pop(key, None)
+            if key in self.dirty:
+                self.dirty.discard(key)
+                self.schedule(key)
+
+    def cancel(self) -> None:
+        for handle in self.pending.values():
+            handle.cancel()
+        self.pending.clear()
+        self.dirty.clear()
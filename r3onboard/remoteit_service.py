@@ -1,10 +1,33 @@
-import json
-import os
 import asyncio
+import json
 import logging
+import os
 import re
+import shlex
 import subprocess
 import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Pattern, Tuple
+
+from .file_watcher import FileWatcher
+from .installer_cache import InstallerCache, InstallerCacheError
+
+
+# Journal matches of the remote.it agent, the units and identifiers are ORed
+JOURNAL_UNITS = ("remoteit-refresh.service", "connectd.service", "schannel.service")
+JOURNAL_IDENTIFIERS = ("remoteit", "remoteit-refresh", "connectd")
+
+CONFIG_FILE = "/etc/remoteit/config.json"
+
+# Journal entries are JSON lines, some can be long
+JOURNAL_LINE_LIMIT = 1024 * 1024
+# journalctl exiting sooner than this (seconds) after starting at a saved
+# cursor is taken as a cursor it can not use
+JOURNAL_QUICK_EXIT = 2.0
+
+# Installer output kept for error reporting, and the longest line kept whole
+INSTALL_OUTPUT_LINES = 50
+INSTALL_LINE_LIMIT = 4096
 
 
 # Enum for Registration Status
@@ -14,12 +37,70 @@ class RegistrationStatus:
     REGISTERED = "REGISTERED"
 
 
+# Enum for the steps of a registration, reported while REGISTERING
+class RegistrationPhase:
+    DOWNLOADING = "DOWNLOADING"
+    INSTALLING = "INSTALLING"
+    REGISTERING = "REGISTERING"
+    STARTING = "STARTING"
+    COMPLETE = "COMPLETE"
+    FAILED = "FAILED"
+
+
+# Rough share of the registration done once a phase is reached
+REGISTRATION_PROGRESS = {
+    RegistrationPhase.DOWNLOADING: 10,
+    RegistrationPhase.INSTALLING: 40,
+    RegistrationPhase.REGISTERING: 70,
+    RegistrationPhase.STARTING: 90,
+    RegistrationPhase.COMPLETE: 100,
+    RegistrationPhase.FAILED: 100,
+}
+
+# Installer output announcing a phase, phases only move forward
+INSTALLER_PHASES: List[Tuple[Pattern[str], str]] = [
+    (re.compile(r"download", re.IGNORECASE), RegistrationPhase.DOWNLOADING),
+    (
+        re.compile(r"install|unpack|setting up", re.IGNORECASE),
+        RegistrationPhase.INSTALLING,
+    ),
+    (re.compile(r"regist", re.IGNORECASE), RegistrationPhase.REGISTERING),
+    (
+        re.compile(r"start|enabl|systemctl", re.IGNORECASE),
+        RegistrationPhase.STARTING,
+    ),
+]
+PHASE_ORDER = [phase for _, phase in INSTALLER_PHASES]
+
+
 class RemoteItService:
     def __init__(self) -> None:
         self.logger = logging.getLogger(name=__name__)
         self._registration_status = RegistrationStatus.UNREGISTERED
         self._device_id: str | None = None
+        self.registration_phase: Optional[str] = None
+        self.registration_progress = 0
+        self.registration_error: Optional[str] = None
+        # Last lines of installer output, stdout and stderr interleaved
+        self.install_output: Deque[str] = deque(maxlen=INSTALL_OUTPUT_LINES)
+        # Restored from disk and not yet confirmed from the agent config
+        self.stale = False
         self.on_change_registration = lambda key, value: None
+        # The agent config is parsed again only when the file changes
+        self.config_watcher = FileWatcher(CONFIG_FILE, self.check_device_registration)
+        self.installer_cache = InstallerCache()
+        # Journal position of the last handled event, so a restart resumes
+        # after it instead of replaying
+        self.cursor_file = "/var/lib/r3onboard/journal.cursor"
+        self.journal_restart_delay = 5.0
+        # Agent log messages that matter, checked in order
+        self.journal_events: List[Tuple[Pattern[str], Callable[[str], None]]] = [
+            (
+                re.compile(r"Updating remote\.it configuration\."),
+                self.on_configuration_update,
+            ),
+            (re.compile(r"Using device uid ="), self.on_device_uid),
+        ]
 
     @property
     def registration_status(self) -> str:
@@ -36,7 +117,7 @@ class RemoteItService:
         return self._device_id
 
     @device_id.setter
-    def device_id(self, value: str) -> None:
+    def device_id(self, value: str | None) -> None:
         if value != self._device_id:
             self._device_id = value
             self.on_change_registration("device_id", value)
@@ -53,6 +134,44 @@ class RemoteItService:
             "registration_status", RegistrationStatus.REGISTERED
         )
 
+    def set_phase(self, phase: Optional[str], error: Optional[str] = None) -> None:
+        if phase == self.registration_phase and error == self.registration_error:
+            return
+        self.registration_phase = phase
+        self.registration_progress = (
+            REGISTRATION_PROGRESS.get(phase, 0) if phase is not None else 0
+        )
+        self.registration_error = error
+        self.on_change_registration("registration_phase", phase)
+
+    def export_state(self) -> Dict[str, Any]:
+        return {
+            "reg": self.registration_status,
+            "id": self.device_id,
+            "phase": self.registration_phase,
+            "progress": self.registration_progress,
+            "error": self.registration_error,
+        }
+
+    def restore_state(self, state: Dict[str, Any]) -> None:
+        # Runs before the callbacks are of use, so no change is reported
+        status = state.get("reg", RegistrationStatus.UNREGISTERED)
+        phase = state.get("phase")
+        if status == RegistrationStatus.REGISTERING or phase in PHASE_ORDER:
+            # The installer was stopped along with the service
+            status = RegistrationStatus.UNREGISTERED
+            phase = None
+        if phase not in REGISTRATION_PROGRESS:
+            phase = None
+        self._registration_status = status
+        self._device_id = state.get("id")
+        self.registration_phase = phase
+        self.registration_progress = (
+            REGISTRATION_PROGRESS[phase] if phase is not None else 0
+        )
+        self.registration_error = state.get("error")
+        self.stale = True
+
     # Is Registered function
     # Check if the device is registered
     def is_registered(self) -> bool:
@@ -60,27 +179,111 @@ class RemoteItService:
 
     async def monitor_remoteit_logs(self) -> None:
         self.logger.info("Monitoring remoteit-agent logs")
+        while True:
+            await self.follow_journal()
+            # journalctl only stops when it fails or is killed, start it again
+            self.logger.warning("journalctl exited, restarting it.")
+            await asyncio.sleep(self.journal_restart_delay)
 
-        command = ["journalctl", "-f"]
+    def journal_command(self, cursor: Optional[str]) -> List[str]:
+        command = ["journalctl", "-f", "-o", "json"]
+        if cursor:
+            command.append(f"--after-cursor={cursor}")
+        else:
+            # Only new entries, old ones would report a past registration
+            command.extend(["-n", "0"])
+        command.extend(f"_SYSTEMD_UNIT={unit}" for unit in JOURNAL_UNITS)
+        command.append("+")
+        command.extend(f"SYSLOG_IDENTIFIER={name}" for name in JOURNAL_IDENTIFIERS)
+        return command
+
+    async def follow_journal(self) -> None:
+        cursor = self.load_cursor()
+        started = asyncio.get_running_loop().time()
         process = await asyncio.create_subprocess_exec(
-            *command, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            *self.journal_command(cursor),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            limit=JOURNAL_LINE_LIMIT,
         )
-
-        while True:
-            if process.stdout is not None:
-                line = await process.stdout.readline()
-                line_str = line.decode()
-                line_str = line_str.strip()
-                if not line_str:
+        try:
+            while process.stdout is not None:
+                try:
+                    line = await process.stdout.readline()
+                except ValueError:
+                    # Longer than the limit, the reader dropped what it had
+                    # buffered. The rest of the entry arrives as a line that
+                    # is not valid JSON and is ignored.
+                    self.logger.warning("Skipping oversized journal entry.")
+                    continue
+                if not line:
+                    # End of file, journalctl is gone
                     break
-                if "Updating remote.it configuration." in line_str:
-                    self.registration_status = "REGISTERING"
-                elif "Using device uid =" in line_str:
-                    self.check_device_registration()
-
-    def check_device_registration(
-        self, config_file: str = "/etc/remoteit/config.json"
-    ) -> None:
+                self.handle_journal_entry(line)
+        finally:
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+        if cursor and asyncio.get_running_loop().time() - started < JOURNAL_QUICK_EXIT:
+            self.logger.warning("journalctl rejected the saved cursor, dropping it.")
+            self.remove_cursor()
+
+    def handle_journal_entry(self, line: bytes) -> None:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return
+        message = entry.get("MESSAGE")
+        if isinstance(message, list):
+            # Messages that are not valid UTF-8 come as byte arrays
+            message = bytes(message).decode(errors="replace")
+        if not isinstance(message, str):
+            return
+        for pattern, handler in self.journal_events:
+            if pattern.search(message):
+                handler(message)
+                self.save_cursor(entry.get("__CURSOR"))
+                break
+
+    def on_configuration_update(self, message: str) -> None:
+        self.registration_status = RegistrationStatus.REGISTERING
+
+    def on_device_uid(self, message: str) -> None:
+        # Usually the watcher has seen the config change already
+        self.config_watcher.check()
+
+    async def watch_config(self) -> None:
+        await self.config_watcher.run()
+
+    def load_cursor(self) -> Optional[str]:
+        try:
+            with open(self.cursor_file, "r") as file:
+                return file.read().strip() or None
+        except OSError:
+            return None
+
+    def save_cursor(self, cursor: Optional[str]) -> None:
+        if not cursor:
+            return
+        # Replaced atomically, journalctl fails on a truncated cursor
+        partial = f"{self.cursor_file}.partial"
+        try:
+            os.makedirs(os.path.dirname(self.cursor_file), exist_ok=True)
+            with open(partial, "w") as file:
+                file.write(cursor)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(partial, self.cursor_file)
+        except OSError as e:
+            self.logger.debug(f"Could not save journal cursor: {e}")
+
+    def remove_cursor(self) -> None:
+        try:
+            os.remove(self.cursor_file)
+        except OSError:
+            pass
+
+    def check_device_registration(self, config_file: str = CONFIG_FILE) -> None:
         # Check if the configuration file exists
         if os.path.isfile(config_file):
             try:
@@ -113,25 +316,87 @@ class RemoteItService:
             self.registration_status = RegistrationStatus.UNREGISTERED
             self.device_id = None
 
+        if self.stale:
+            self.stale = False
+            self.on_change_registration("stale", "False")
+
     async def install_remoteit_agent_async(
         self, registrationCode: str
     ) -> tuple[str, str]:
-        # Prepare the command string with the registration code
         self.registration_status = RegistrationStatus.REGISTERING
-        command = (
-            f'R3_REGISTRATION_CODE="{registrationCode}" '
-            'sh -c "$(curl -L https://downloads.remote.it/remoteit/install_agent.sh)"'
-        )
+        self.install_output.clear()
+        self.set_phase(RegistrationPhase.DOWNLOADING)
+        try:
+            installer = await self.installer_cache.fetch()
+            command = f"sh {shlex.quote(installer)}"
+        except InstallerCacheError as e:
+            if self.installer_cache.sha256 is not None:
+                # A pinned installer must not be replaced by an unverified one
+                self.logger.error(f"No verified installer: {e}")
+                self.check_device_registration()
+                self.set_phase(RegistrationPhase.FAILED, str(e))
+                return "", str(e)
+            self.logger.warning(f"Installer cache unavailable, streaming it: {e}")
+            command = 'sh -c "$(curl -L https://downloads.remote.it/remoteit/install_agent.sh)"'
 
-        # Create the subprocess using asyncio's subprocess functions
+        # The code comes from the central, it is never part of the command
         process = await asyncio.create_subprocess_shell(
-            command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env={**os.environ, "R3_REGISTRATION_CODE": registrationCode},
         )
-
-        # You can wait for the process to complete, or handle it in another way depending on your needs
-        stdout, stderr = await process.communicate()
+        try:
+            await asyncio.gather(
+                self.read_install_output(process.stdout),
+                self.read_install_output(process.stderr),
+            )
+            returncode = await process.wait()
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
 
         self.check_device_registration()
+        if self.is_registered():
+            self.set_phase(RegistrationPhase.COMPLETE)
+        else:
+            error = self.install_output[-1] if self.install_output else None
+            self.logger.error(
+                f"Installer exited with {returncode}, last output:\n"
+                + "\n".join(self.install_output)
+            )
+            self.set_phase(
+                RegistrationPhase.FAILED, error or f"Installer exited with {returncode}"
+            )
+        return "\n".join(self.install_output), self.registration_error or ""
 
-        # Here we simply return stdout and stderr, you might want to handle them differently
-        return stdout.decode(), stderr.decode()
+    async def read_install_output(self, stream: Optional[asyncio.StreamReader]) -> None:
+        # Lines end in \n or \r (progress bars), overlong ones are cut
+        pending = b""
+        while stream is not None:
+            chunk = await stream.read(INSTALL_LINE_LIMIT)
+            if not chunk:
+                break
+            lines = re.split(rb"[\r\n]", pending + chunk)
+            pending = lines.pop()
+            if len(pending) >= INSTALL_LINE_LIMIT:
+                lines.append(pending)
+                pending = b""
+            for line in lines:
+                self.handle_install_line(line)
+        self.handle_install_line(pending)
+
+    def handle_install_line(self, line: bytes) -> None:
+        text = line.decode(errors="replace").strip()
+        if not text:
+            return
+        self.install_output.append(text)
+        self.logger.debug(f"Installer: {text}")
+        reached = 0
+        if self.registration_phase in PHASE_ORDER:
+            reached = PHASE_ORDER.index(self.registration_phase) + 1
+        for pattern, phase in INSTALLER_PHASES[reached:]:
+            if pattern.search(text):
+                self.set_phase(phase)
+                break
@@ -0,0 +1,159 @@
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+
+# NetworkManager 802.11 access point flags
+NM_802_11_AP_FLAGS_PRIVACY = 0x1
+NM_802_11_AP_SEC_KEY_MGMT_PSK = 0x100
+NM_802_11_AP_SEC_KEY_MGMT_802_1X = 0x200
+NM_802_11_AP_SEC_KEY_MGMT_SAE = 0x400
+NM_802_11_AP_SEC_KEY_MGMT_OWE = 0x800
+
+
+def security_of(flags: int, wpa_flags: int, rsn_flags: int) -> str:
+    # Same names nmcli shows in its SECURITY column, empty for open networks
+    security = []
+    if flags & NM_802_11_AP_FLAGS_PRIVACY and not wpa_flags and not rsn_flags:
+        security.append("WEP")
+    if wpa_flags:
+        security.append("WPA1")
+    if rsn_flags & (NM_802_11_AP_SEC_KEY_MGMT_PSK | NM_802_11_AP_SEC_KEY_MGMT_802_1X):
+        security.append("WPA2")
+    if rsn_flags & NM_802_11_AP_SEC_KEY_MGMT_SAE:
+        security.append("WPA3")
+    if rsn_flags & NM_802_11_AP_SEC_KEY_MGMT_OWE:
+        security.append("OWE")
+    if (wpa_flags | rsn_flags) & NM_802_11_AP_SEC_KEY_MGMT_802_1X:
+        security.append("802.1X")
+    return " ".join(security)
+
+
+class ScanRecord:
+    """One access point seen by a scan."""
+
+    __slots__ = ("bssid", "ssid", "frequency", "signal", "security", "last_seen")
+
+    def __init__(
+        self,
+        bssid: str,
+        ssid: str,
+        frequency: int,
+        signal: int,
+        security: str,
+        last_seen: float,
+    ) -> None:
+        self.bssid = bssid
+        self.ssid = ssid
+        self.frequency = frequency
+        # Strength in percent as NetworkManager reports it
+        self.signal = signal
+        self.security = security
+        self.last_seen = last_seen
+
+
+class ScanStore:
+    """Scan results by BSSID, bounded to the strongest access points.
+
+    The strongest access point of every SSID is kept up to date as records
+    arrive, so the per SSID list never needs to be rebuilt from all records.
+    """
+
+    def __init__(
+        self, capacity: int, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.logger = logging.getLogger(name=__name__)
+        self.capacity = capacity
+        self.clock = clock
+        self.records: Dict[str, ScanRecord] = {}
+        # SSID -> BSSIDs advertising it
+        self.members: Dict[str, Set[str]] = {}
+        # SSID -> its strongest record
+        self.best: Dict[str, ScanRecord] = {}
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def add(
+        self,
+        bssid: str,
+        ssid: str,
+        frequency: int,
+        signal: int,
+        security: str = "",
+        now: Optional[float] = None,
+    ) -> None:
+        now = self.clock() if now is None else now
+        record = self.records.get(bssid)
+        if record is not None and record.ssid != ssid:
+            self.remove(bssid)
+            record = None
+
+        if record is None:
+            if len(self.records) >= self.capacity and not self.make_room(signal):
+                return
+            record = ScanRecord(bssid, ssid, frequency, signal, security, now)
+            self.records[bssid] = record
+            self.members.setdefault(ssid, set()).add(bssid)
+        else:
+            weaker = signal < record.signal
+            record.frequency = frequency
+            record.signal = signal
+            record.security = security
+            record.last_seen = now
+            if weaker and self.best.get(ssid) is record:
+                self.update_best(ssid)
+                return
+
+        best = self.best.get(ssid)
+        if best is None or record.signal > best.signal:
+            self.best[ssid] = record
+
+    def make_room(self, signal: int) -> bool:
+        # Drop the weakest record unless the new one is weaker still
+        weakest = min(self.records.values(), key=lambda record: record.signal)
+        if weakest.signal >= signal:
+            return False
+        self.logger.debug(f"Scan store full, dropping {weakest.bssid}")
+        self.remove(weakest.bssid)
+        return True
+
+    def remove(self, bssid: str) -> Optional[ScanRecord]:
+        record = self.records.pop(bssid, None)
+        if record is None:
+            return None
+        members = self.members[record.ssid]
+        members.discard(bssid)
+        if not members:
+            del self.members[record.ssid]
+            del self.best[record.ssid]
+        elif self.best.get(record.ssid) is record:
+            self.update_best(record.ssid)
+        return record
+
+    def update_best(self, ssid: str) -> None:
+        self.best[ssid] = max(
+            (self.records[bssid] for bssid in self.members[ssid]),
+            key=lambda record: record.signal,
+        )
+
+    def expire(self, max_age: float, now: Optional[float] = None) -> List[str]:
+        # Remove access points not seen within max_age, returns their BSSIDs
+        now = self.clock() if now is None else now
+        expired = [
+            bssid
+            for bssid, record in self.records.items()
+            if now - record.last_seen > max_age
+        ]
+        for bssid in expired:
+            self.remove(bssid)
+        return expired
+
+    def clear(self) -> None:
+        self.records.clear()
+        self.members.clear()
+        self.best.clear()
+
+    def networks(self) -> Dict[str, int]:
+        # SSID -> signal of its strongest access point, hidden networks left out
+        return {ssid: record.signal for ssid, record in self.best.items() if ssid}
@@ -0,0 +1,42 @@
+from typing import Dict, Optional
+
+from .ble_framing import Encoding, encode_payload
+
+
+class Snapshot:
+    """Pre-encoded characteristic value with the version it was built at."""
+
+    __slots__ = ("version", "text", "encoded")
+
+    def __init__(self, version: int, text: str) -> None:
+        self.version = version
+        self.text = text
+        self.encoded: Dict[str, bytes] = {Encoding.JSON: text.encode("utf-8")}
+
+    def encode(self, encoding: str) -> bytes:
+        # Other encodings are derived once per snapshot, on first use
+        payload = self.encoded.get(encoding)
+        if payload is None:
+            payload = encode_payload(self.text, encoding)
+            self.encoded[encoding] = payload
+        return payload
+
+
+class SnapshotStore:
+    """Latest value of each characteristic, rebuilt only when state changes."""
+
+    def __init__(self) -> None:
+        self.version = 0
+        self.snapshots: Dict[str, Snapshot] = {}
+
+    def update(self, key: str, text: str) -> Snapshot:
+        snapshot = self.snapshots.get(key)
+        if snapshot is not None and snapshot.text == text:
+            return snapshot
+        self.version += 1
+        snapshot = Snapshot(self.version, text)
+        self.snapshots[key] = snapshot
+        return snapshot
+
+    def get(self, key: str) -> Optional[Snapshot]:
+        return self.snapshots.get(key)
@@ -0,0 +1,61 @@
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+
+# Bumped when the layout changes, older files are ignored
+STATE_VERSION = 1
+
+
+class StateStore:
+    """Onboarding state kept on disk so a restart can answer right away.
+
+    The file is replaced atomically, a crash leaves either the old or the new
+    state behind. Writes that would not change the content are skipped.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.logger = logging.getLogger(name=__name__)
+        # Empty disables persistence
+        self.path = path
+        self.last_written: Optional[str] = None
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        if not self.path:
+            return None
+        try:
+            with open(self.path, "r") as file:
+                state = json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable state file: {e}")
+            return None
+        if not isinstance(state, dict) or state.get("version") != STATE_VERSION:
+            self.logger.info("Ignoring state file of another version")
+            return None
+        return state
+
+    def save(self, state: Dict[str, Any]) -> bool:
+        if not self.path:
+            return False
+        content = json.dumps(state, sort_keys=True)
+        if content == self.last_written:
+            return False
+        partial = f"{self.path}.partial"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(partial, "w") as file:
+                json.dump(
+                    {"version": STATE_VERSION, "saved_at": time.time(), **state}, file
+                )
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(partial, self.path)
+        except OSError as e:
+            self.logger.warning(f"Could not save state: {e}")
+            return False
+        self.last_written = content
+        return True
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from dbus_next import DBusError, Message, MessageType
+from dbus_next.aio import MessageBus
+from dbus_next.aio.proxy_object import ProxyInterface, ProxyObject
+from dbus_next.constants import BusType
+from dbus_next.introspection import Node
+
+
+PROPERTIES_INTERFACE = "org.freedesktop.DBus.Properties"
+
+
+class SystemBus:
+    """One system bus connection shared by the services of the process.
+
+    Introspection data, proxy objects and proxy interfaces are cached by
+    (service, path) and (service, path, interface), so each object is only
+    introspected once until its entries are invalidated.
+    """
+
+    def __init__(self) -> None:
+        self.logger = logging.getLogger(name=__name__)
+        self.bus: Optional[MessageBus] = None
+        self.lock = asyncio.Lock()
+        self.introspections: Dict[Tuple[str, str], Node] = {}
+        self.proxy_objects: Dict[Tuple[str, str], ProxyObject] = {}
+        self.interfaces: Dict[Tuple[str, str, str], ProxyInterface] = {}
+
+    async def get_bus(self) -> MessageBus:
+        async with self.lock:
+            if self.bus is None or not self.bus.connected:
+                self.logger.debug("Connecting to the system bus")
+                self.bus = await MessageBus(bus_type=BusType.SYSTEM).connect()
+                self.invalidate()
+            return self.bus
+
+    async def get_proxy_object(self, service: str, path: str) -> ProxyObject:
+        key = (service, path)
+        proxy_object = self.proxy_objects.get(key)
+        if proxy_object is None:
+            bus = await self.get_bus()
+            introspection = self.introspections.get(key)
+            if introspection is None:
+                introspection = await bus.introspect(service, path)
+                self.introspections[key] = introspection
+            proxy_object = bus.get_proxy_object(service, path, introspection)
+            self.proxy_objects[key] = proxy_object
+        return proxy_object
+
+    async def get_interface(
+        self, service: str, path: str, interface: str
+    ) -> ProxyInterface:
+        key = (service, path, interface)
+        proxy_interface = self.interfaces.get(key)
+        if proxy_interface is None:
+            proxy_object = await self.get_proxy_object(service, path)
+            proxy_interface = proxy_object.get_interface(interface)
+            self.interfaces[key] = proxy_interface
+        return proxy_interface
+
+    def invalidate(self, service: Optional[str] = None, path: str = "/") -> None:
+        # Drop cached entries of a service at and below a path, everything by default
+        def matches(key: Tuple[str, ...]) -> bool:
+            if service is not None and key[0] != service:
+                return False
+            return path == "/" or key[1] == path or key[1].startswith(path + "/")
+
+        for cache in (self.introspections, self.proxy_objects, self.interfaces):
+            for key in [key for key in cache if matches(key)]:
+                del cache[key]  # type: ignore
+
+    async def call(
+        self,
+        service: str,
+        path: str,
+        interface: str,
+        member: str,
+        signature: str = "",
+        body: Optional[List[Any]] = None,
+    ) -> List[Any]:
+        # Plain method call, no introspection needed
+        bus = await self.get_bus()
+        reply = await bus.call(
+            Message(
+                destination=service,
+                path=path,
+                interface=interface,
+                member=member,
+                signature=signature,
+                body=body or [],
+            )
+        )
+        if reply is None:
+            raise DBusError(
+                "org.freedesktop.DBus.Error.NoReply", f"No reply to {member}"
+            )
+        if reply.message_type == MessageType.ERROR:
+            raise DBusError(reply.error_name, str(reply.body))
+        return reply.body
+
+    async def get_property(
+        self, service: str, path: str, interface: str, name: str
+    ) -> Any:
+        body = await self.call(
+            service, path, PROPERTIES_INTERFACE, "Get", "ss", [interface, name]
+        )
+        return body[0].value
+
+    async def get_all_properties(
+        self, service: str, path: str, interface: str
+    ) -> Dict[str, Any]:
+        # One round trip for all properties of an object
+        body = await self.call(
+            service, path, PROPERTIES_INTERFACE, "GetAll", "s", [interface]
+        )
+        return {name: variant.value for name, variant in body[0].items()}
+
+    async def add_match(self, rule: str) -> None:
+        await self.call(
+            "org.freedesktop.DBus",
+            "/org/freedesktop/DBus",
+            "org.freedesktop.DBus",
+            "AddMatch",
+            "s",
+            [rule],
+        )
+
+    def disconnect(self) -> None:
+        if self.bus is not None and self.bus.connected:
+            self.bus.disconnect()
+        self.bus = None
+        self.invalidate()
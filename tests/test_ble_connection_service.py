@@ -0,0 +1,37 @@
+import pytest
+from dbus_next import Variant
+
+from r3onboard.ble_connection_service import BleConnectionService
+
+
+DEVICE_PATH = "/org/bluez/hci0/dev_AA_BB_CC_DD_EE_FF"
+
+
+class TestBleConnectionService:
+    def setup_method(self, method):
+        self.connections = BleConnectionService()
+
+    def test_tracks_mtu_of_connected_devices(self):
+        self.connections.update_interfaces(
+            DEVICE_PATH,
+            {
+                "org.bluez.Device1": {
+                    "Address": Variant("s", "AA:BB:CC:DD:EE:FF"),
+                    "Connected": Variant("b", True),
+                }
+            },
+        )
+        self.connections.update_interfaces(
+            f"{DEVICE_PATH}/service0010/char0011",
+            {"org.bluez.GattCharacteristic1": {"MTU": Variant("q", 185)}},
+        )
+        assert self.connections.get_mtu() == 185
+        assert self.connections.get_mtu("AA:BB:CC:DD:EE:FF") == 185
+        assert self.connections.get_mtu(DEVICE_PATH) == 185
+
+        self.connections.update_device(DEVICE_PATH, {"Connected": Variant("b", False)})
+        assert self.connections.get_mtu() is None
+
+
+if __name__ == "__main__":
+    pytest.main()
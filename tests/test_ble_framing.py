@@ -0,0 +1,77 @@
+import zlib
+
+import pytest
+
+from r3onboard.ble_framing import (
+    FRAME_HEADER,
+    Encoding,
+    FrameAssembler,
+    FramingError,
+    LegacyAssembler,
+    OutgoingMessage,
+    Protocol,
+    encode_payload,
+    is_framed,
+)
+
+
+def drain(message, chunk_size):
+    chunks = []
+    while not message.done:
+        chunks.append(message.next_chunk(chunk_size))
+    return chunks
+
+
+class TestBleFraming:
+    def test_framed_round_trip(self):
+        data = '{"command": "WIFI_CONNECT", "ssid": "Café [END]", "password": "x"}'
+        message = OutgoingMessage(data.encode("utf-8"), Protocol.FRAMED, 7)
+        chunks = drain(message, 20)
+        assert all(is_framed(chunk) for chunk in chunks)
+        assert all(len(chunk) <= 20 for chunk in chunks)
+
+        assembler = FrameAssembler()
+        results = [assembler.feed(bytes(chunk)) for chunk in chunks]
+        assert results[:-1] == [None] * (len(chunks) - 1)
+        assert results[-1].decode("utf-8") == data
+
+    def test_framed_out_of_order(self):
+        message = OutgoingMessage(b"x" * 40, Protocol.FRAMED, 1)
+        chunks = drain(message, FRAME_HEADER.size + 10)
+        assembler = FrameAssembler()
+        assembler.feed(bytes(chunks[0]))
+        with pytest.raises(FramingError):
+            assembler.feed(bytes(chunks[2]))
+
+    def test_legacy_chunks_keep_characters_whole(self):
+        data = "ééééé".encode("utf-8")
+        message = OutgoingMessage(data, Protocol.LEGACY)
+        chunks = drain(message, 8)
+        for chunk in chunks:
+            bytes(chunk).decode("utf-8")
+        assert b"".join(chunks) == b"[START]" + data + b"[END]"
+
+    @pytest.mark.parametrize("length", [10, 11, 13, 15, 16])
+    def test_legacy_end_marker_is_never_split(self, length):
+        # [START] plus the data fills 17 to 23 bytes of 20 byte chunks
+        data = b"x" * length
+        chunks = drain(OutgoingMessage(data, Protocol.LEGACY), 20)
+        assert all(len(chunk) <= 20 for chunk in chunks)
+        assert chunks[-1].endswith(b"[END]")
+        assert not any(b"[E" in chunk for chunk in chunks[:-1])
+        assert b"".join(chunks) == b"[START]" + data + b"[END]"
+
+    def test_legacy_assembler(self):
+        assembler = LegacyAssembler()
+        assert assembler.feed(b'[START]{"command": ') is None
+        assert assembler.feed(b'"WIFI_SCAN"}[END]') == b'{"command": "WIFI_SCAN"}'
+
+    def test_deflate_payload(self):
+        data = '[{"ssid": "Office", "signal": 80}]' * 20
+        payload = encode_payload(data, Encoding.DEFLATE)
+        assert len(payload) < len(data)
+        assert zlib.decompress(payload, -15).decode("utf-8") == data
+
+
+if __name__ == "__main__":
+    pytest.main()
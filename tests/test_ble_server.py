@@ -1,11 +1,18 @@
+import asyncio
+import json
 import sys
+import time
+
 
 print(sys.path)
 
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
+from dbus_next import Variant
 
+from r3onboard import gatt_options
+from r3onboard.ble_framing import Encoding, OutgoingMessage, Protocol
 from r3onboard.ble_server import (
     BleServer,
 )
@@ -14,9 +21,218 @@ from r3onboard.ble_server import (
 class TestBLEServer:
     @patch("r3onboard.ble_server.BlessServer")
     def setup_method(self, method, MockBlessServer):
-        self.server = BleServer()
+        self.server = BleServer("-1")
         self.server.server = MockBlessServer()
 
+    def test_chunk_size(self):
+        # Unknown MTU falls back to the default MTU
+        assert self.server.chunk_size() == 248
+        # Negotiated MTU reported with the request
+        assert self.server.chunk_size({"mtu": 185}) == 182
+        # Clamped to the configured floor and ceiling
+        assert self.server.chunk_size({"mtu": 10}) == 20
+        assert self.server.chunk_size({"mtu": 1024}) == 509
+
+    def test_set_encoding_requires_framing(self):
+        characteristic = MagicMock(uuid=BleServer.COMMAND_CHARACTERISTIC_UUID)
+        message = '{"command": "SET_ENCODING", "encoding": "DEFLATE"}'
+
+        self.server.process_full_message(characteristic, message)
+        assert self.server.sessions.encodings == {}
+
+        self.server.sessions.protocols[""] = Protocol.FRAMED
+        self.server.process_full_message(characteristic, message)
+        assert self.server.sessions.encodings[""] == Encoding.DEFLATE
+
+    @pytest.mark.asyncio
+    async def test_encoding_is_per_central(self):
+        command = MagicMock(uuid=BleServer.COMMAND_CHARACTERISTIC_UUID)
+        status = MagicMock(uuid=BleServer.WIFI_STATUS_CHARACTERISTIC_UUID)
+        first = "/org/bluez/hci0/dev_AA"
+        second = "/org/bluez/hci0/dev_BB"
+        for device in (first, second):
+            self.server.sessions.protocols[device] = Protocol.FRAMED
+        message = '{"command": "SET_ENCODING", "encoding": "DEFLATE"}'
+        self.server.process_full_message(command, message, first)
+
+        with patch.object(
+            self.server, "create_message", wraps=self.server.create_message
+        ) as mock_create:
+            self.server.read_request(status, device=Variant("o", second))
+            assert mock_create.call_args.args[3] == Encoding.JSON
+            self.server.read_request(status, device=Variant("o", first))
+            assert mock_create.call_args.args[3] == Encoding.DEFLATE
+
+        self.server.on_disconnect_device(first, "AA")
+        assert first not in self.server.sessions.encodings
+        self.server.notifications.cancel()
+
+    @pytest.mark.asyncio
+    async def test_read_serves_snapshot(self):
+        characteristic = MagicMock(uuid=BleServer.WIFI_STATUS_CHARACTERISTIC_UUID)
+        version = self.server.snapshots.get(characteristic.uuid).version
+
+        with patch.object(
+            self.server.network_manager, "get_current_ssid"
+        ) as mock_get_current_ssid:
+            self.server.network_manager.error = "INVALID_SSID"
+            chunk = self.server.read_request(characteristic)
+            mock_get_current_ssid.assert_not_called()
+
+        snapshot = self.server.snapshots.get(characteristic.uuid)
+        assert snapshot.version > version
+        assert b"INVALID_SSID" in chunk
+        self.server.notifications.cancel()
+
+    @pytest.mark.asyncio
+    async def test_command_stream_acks_and_nacks(self):
+        characteristic = MagicMock(uuid=BleServer.COMMAND_STREAM_CHARACTERISTIC_UUID)
+        data = b'{"command": "SET_ENCODING", "encoding": "JSON"}'
+        chunks = []
+        message = OutgoingMessage(data, Protocol.FRAMED, 5)
+        while not message.done:
+            chunks.append(message.next_chunk(20))
+
+        with patch.object(self.server, "send_stream_reply") as mock_reply:
+            # A lost chunk rejects the message once
+            self.server.write_request(characteristic, chunks[0])
+            for chunk in chunks[2:]:
+                self.server.write_request(characteristic, chunk)
+            mock_reply.assert_called_once()
+            assert mock_reply.call_args.args[0]["nack"] == 5
+
+            mock_reply.reset_mock()
+            with patch.object(self.server, "process_full_message") as mock_process:
+                for chunk in chunks:
+                    self.server.write_request(characteristic, chunk)
+                mock_process.assert_called_once()
+            mock_reply.assert_called_once_with({"ack": 5})
+
+    @pytest.mark.asyncio
+    async def test_centrals_have_their_own_sessions(self):
+        characteristic = MagicMock(uuid=BleServer.COMMAND_CHARACTERISTIC_UUID)
+        first = Variant("o", "/org/bluez/hci0/dev_AA")
+        second = Variant("o", "/org/bluez/hci0/dev_BB")
+
+        with patch.object(self.server, "process_full_message") as mock_process:
+            self.server.write_request(characteristic, b"[START]{", device=first)
+            self.server.write_request(characteristic, b"[START]{", device=second)
+            self.server.write_request(characteristic, b"}[END]", device=first)
+            mock_process.assert_called_once_with(
+                characteristic, "{}", "/org/bluez/hci0/dev_AA"
+            )
+
+    @pytest.mark.asyncio
+    async def test_second_registration_code_is_ignored(self):
+        characteristic = MagicMock(uuid=BleServer.COMMAND_CHARACTERISTIC_UUID)
+        install = AsyncMock()
+        self.server.remoteit_registration.install_remoteit_agent_async = install
+
+        with patch.object(self.server.logger, "warning") as mock_warning:
+            for code in ("first", "first", "second"):
+                message = json.dumps({"command": "R3_REGISTER", "code": code})
+                self.server.process_full_message(characteristic, message)
+            await self.server.commands.tasks["R3_REGISTER"]
+            mock_warning.assert_called_once()
+            assert "second" in mock_warning.call_args.args[0]
+
+        install.assert_awaited_once_with("first")
+
+    @pytest.mark.asyncio
+    async def test_legacy_central_after_framed_one(self):
+        command = MagicMock(uuid=BleServer.COMMAND_CHARACTERISTIC_UUID)
+        status = MagicMock(uuid=BleServer.WIFI_STATUS_CHARACTERISTIC_UUID)
+        first = "/org/bluez/hci0/dev_AA"
+        second = "/org/bluez/hci0/dev_BB"
+        message = OutgoingMessage(b'{"command": "IS_CONNECTED"}', Protocol.FRAMED, 1)
+
+        with patch.object(self.server, "process_full_message"):
+            while not message.done:
+                self.server.write_request(
+                    command, message.next_chunk(20), device=Variant("o", first)
+                )
+        assert self.server.protocol == Protocol.FRAMED
+
+        self.server.ble_connections.connected = {}
+        self.server.on_disconnect_device(first, "AA")
+        assert self.server.protocol == Protocol.LEGACY
+
+        self.server.ble_connections.connected = {second: "BB"}
+        chunk = self.server.read_request(status, device=Variant("o", second))
+        assert chunk.startswith(b"[START]")
+        self.server.notifications.cancel()
+
+    def test_gatt_options_reach_handlers(self):
+        server = MagicMock()
+        on_read = MagicMock(return_value=bytearray(b"value"))
+        on_write = MagicMock()
+        gatt_options.install(server, on_read, on_write)
+        characteristic = MagicMock(UUID="a001")
+        options = {"device": Variant("o", "/org/bluez/hci0/dev_AA")}
+
+        assert server.app.ReadWithOptions(characteristic, options) == b"value"
+        on_read.assert_called_once_with(
+            server.get_characteristic.return_value, **options
+        )
+        server.app.WriteWithOptions(characteristic, b"data", options)
+        on_write.assert_called_once_with(
+            server.get_characteristic.return_value, bytearray(b"data"), **options
+        )
+
+    @pytest.mark.asyncio
+    async def test_gatt_options_installed_after_setup(self):
+        class SetupServer:
+            # Like bless, the application only exists once setup has run
+            def __init__(self):
+                self.setup_task = asyncio.get_event_loop().create_task(self.setup())
+                self.added_with_options = None
+
+            async def setup(self):
+                await asyncio.sleep(0)
+                self.app = MagicMock(spec=["Read", "Write"])
+
+            async def add_gatt(self, gatt):
+                self.added_with_options = hasattr(self.app, "ReadWithOptions")
+
+        server = SetupServer()
+        self.server.server = server
+        with patch.object(self.server.logger, "warning") as mock_warning:
+            await self.server.setup_gatt_server()
+            mock_warning.assert_not_called()
+        assert server.added_with_options is True
+
+    def test_serves_restored_state(self, tmp_path):
+        self.server.state_store.path = str(tmp_path / "state.json")
+        self.server.state_store.save(
+            {
+                "network": {
+                    "wlan": "CONNECTED",
+                    "ssid": "Artemis",
+                    "access_points": [["aa", "Artemis", 2437, 70, "WPA2", time.time()]],
+                },
+                "registration": {"reg": "REGISTERED", "id": "device-1"},
+            }
+        )
+
+        self.server.restore_state()
+        self.server.update_snapshots()
+
+        snapshots = self.server.snapshots
+        wifi_list = json.loads(
+            snapshots.get(BleServer.WIFI_LIST_CHARACTERISTIC_UUID).text
+        )
+        assert wifi_list[0]["ssid"] == "Artemis"
+        status = json.loads(
+            snapshots.get(BleServer.WIFI_STATUS_CHARACTERISTIC_UUID).text
+        )
+        assert status["wlan"] == "CONNECTED"
+        assert status["stale"]
+        registration = json.loads(
+            snapshots.get(BleServer.REGISTRATION_STATUS_CHARACTERISTIC_UUID).text
+        )
+        assert registration["id"] == "device-1"
+        assert registration["stale"]
+
 
 if __name__ == "__main__":
     pytest.main()
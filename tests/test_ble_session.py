@@ -0,0 +1,65 @@
+import pytest
+
+from r3onboard.ble_framing import OutgoingMessage, Protocol
+from r3onboard.ble_session import SessionTable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSessionTable:
+    def setup_method(self, method):
+        self.clock = FakeClock()
+        self.sessions = SessionTable(1024, 100, 60, clock=self.clock)
+
+    def test_sessions_are_per_device(self):
+        first = self.sessions.get("AA", "char")
+        second = self.sessions.get("BB", "char")
+        assert first is not second
+        assert self.sessions.get("AA", "char") is first
+
+    def test_evicts_idle_sessions(self):
+        self.sessions.get("AA", "char")
+        self.clock.now = 30
+        self.sessions.get("BB", "char")
+        self.clock.now = 70
+        self.sessions.get("BB", "other")
+        assert self.sessions.find("AA", "char") is None
+        assert self.sessions.find("BB", "char") is not None
+
+    def test_enforces_memory_budget(self):
+        old = self.sessions.get("AA", "char")
+        old.outgoing = OutgoingMessage(b"x" * 80, Protocol.FRAMED)
+        new = self.sessions.get("BB", "char")
+        new.outgoing = OutgoingMessage(b"x" * 80, Protocol.FRAMED)
+        self.sessions.enforce_budget(keep=new)
+        assert self.sessions.find("AA", "char") is None
+        assert self.sessions.find("BB", "char") is new
+
+    def test_queries_outlive_evicted_sessions(self):
+        self.sessions.get("AA", "char")
+        self.sessions.queries["AA"] = {"limit": 10}
+        self.clock.now = 70
+        self.sessions.evict_idle()
+        assert len(self.sessions) == 0
+        assert self.sessions.queries["AA"] == {"limit": 10}
+
+        self.sessions.remove_device("AA")
+        assert "AA" not in self.sessions.queries
+
+    def test_remove_device(self):
+        self.sessions.get("AA", "char")
+        self.sessions.get("AA", "other")
+        self.sessions.protocols["AA"] = Protocol.FRAMED
+        self.sessions.remove_device("AA")
+        assert len(self.sessions) == 0
+        assert "AA" not in self.sessions.protocols
+
+
+if __name__ == "__main__":
+    pytest.main()
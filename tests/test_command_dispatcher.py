@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from r3onboard.command_dispatcher import CommandDispatcher
+
+
+class TestCommandDispatcher:
+    @pytest.mark.asyncio
+    async def test_single_flight_joins_running_command(self):
+        dispatcher = CommandDispatcher()
+        calls = []
+
+        async def scan():
+            calls.append("scan")
+            await asyncio.sleep(0.01)
+
+        tasks = [dispatcher.single_flight("WIFI_SCAN", scan) for _ in range(5)]
+        await asyncio.gather(*tasks)
+
+        assert calls == ["scan"]
+        assert not dispatcher.in_flight("WIFI_SCAN")
+
+    @pytest.mark.asyncio
+    async def test_replace_cancels_previous_command(self):
+        dispatcher = CommandDispatcher()
+        finished = []
+
+        events = []
+
+        async def connect(ssid):
+            events.append(f"start {ssid}")
+            try:
+                await asyncio.sleep(0.01)
+                finished.append(ssid)
+            finally:
+                events.append(f"end {ssid}")
+
+        first = dispatcher.replace("WIFI_CONNECT", lambda: connect("first"))
+        await asyncio.sleep(0)
+        second = dispatcher.replace("WIFI_CONNECT", lambda: connect("second"))
+        await second
+
+        assert first.cancelled()
+        assert finished == ["second"]
+        # The replacement starts only after the cancelled run cleaned up
+        assert events == ["start first", "end first", "start second", "end second"]
+
+    @pytest.mark.asyncio
+    async def test_group_limit_and_queue_depth(self):
+        dispatcher = CommandDispatcher(
+            groups={"WIFI_SCAN": "radio", "WIFI_CONNECT": "radio"}
+        )
+        events = []
+        release = asyncio.Event()
+
+        async def connect():
+            events.append("start connect")
+            await release.wait()
+            events.append("end connect")
+
+        async def scan():
+            events.append("scan")
+
+        connecting = dispatcher.single_flight("WIFI_CONNECT", connect)
+        await asyncio.sleep(0)
+        scanning = dispatcher.single_flight("WIFI_SCAN", scan)
+        await asyncio.sleep(0)
+        # The scan waits for the connection attempt to free the radio
+        assert events == ["start connect"]
+        assert dispatcher.queue_depth("radio") == 1
+
+        release.set()
+        await asyncio.gather(connecting, scanning)
+        assert events == ["start connect", "end connect", "scan"]
+        assert dispatcher.queue_depth("radio") == 0
+
+
+if __name__ == "__main__":
+    pytest.main()
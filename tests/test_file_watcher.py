@@ -0,0 +1,44 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+
+from r3onboard.file_watcher import FileWatcher
+
+
+class TestFileWatcher:
+    def setup_method(self, method):
+        self.on_change = MagicMock()
+
+    def test_check_only_reports_changes(self, tmp_path):
+        config = tmp_path / "config.json"
+        watcher = FileWatcher(str(config), self.on_change)
+
+        assert not watcher.check()
+        config.write_text("{}")
+        assert watcher.check()
+        assert not watcher.check()
+        config.unlink()
+        assert watcher.check()
+        assert self.on_change.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_run_sees_replaced_file(self, tmp_path):
+        config = tmp_path / "config.json"
+        changed = asyncio.Event()
+        watcher = FileWatcher(
+            str(config), changed.set, poll_interval=0.01, safety_interval=0.01
+        )
+        task = asyncio.create_task(watcher.run())
+        await asyncio.sleep(0.05)
+        changed.clear()
+
+        # Written next to it and renamed over it, the way agents replace configs
+        (tmp_path / "config.json.tmp").write_text('{"device": {"id": "80:00"}}')
+        (tmp_path / "config.json.tmp").rename(config)
+        await asyncio.wait_for(changed.wait(), 1)
+        task.cancel()
+
+
+if __name__ == "__main__":
+    pytest.main()
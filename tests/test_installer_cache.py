@@ -0,0 +1,78 @@
+import hashlib
+import os
+from unittest.mock import patch
+
+import pytest
+
+from r3onboard.installer_cache import InstallerCache, InstallerCacheError
+from r3onboard.network_manager_service import CommandResult
+
+
+SCRIPT = b"#!/bin/sh\necho installing\n"
+SCRIPT_SHA256 = hashlib.sha256(SCRIPT).hexdigest()
+
+
+class TestInstallerCache:
+    def setup_method(self, method):
+        self.downloads = 0
+
+    def make_cache(self, tmp_path, **kwargs):
+        return InstallerCache(cache_dir=str(tmp_path / "cache"), **kwargs)
+
+    async def fake_curl(self, *command, timeout=None):
+        # curl ... -o <path> <url>
+        self.downloads += 1
+        with open(command[-2], "wb") as file:
+            file.write(SCRIPT)
+        return CommandResult(0, b"", b"", 0.1)
+
+    @pytest.mark.asyncio
+    async def test_prefers_preseeded_source(self, tmp_path):
+        source = tmp_path / "source"
+        source.mkdir()
+        (source / "install_agent.sh").write_bytes(SCRIPT)
+        cache = self.make_cache(tmp_path, source_dir=str(source), sha256=SCRIPT_SHA256)
+
+        with patch.object(cache.commands, "run", side_effect=self.fake_curl):
+            assert await cache.fetch() == str(source / "install_agent.sh")
+        assert self.downloads == 0
+
+    @pytest.mark.asyncio
+    async def test_downloads_once_then_uses_cache(self, tmp_path):
+        cache = self.make_cache(tmp_path)
+
+        with patch.object(cache.commands, "run", side_effect=self.fake_curl):
+            path = await cache.fetch()
+            assert await cache.fetch() == path
+        assert path == cache.cached_path(SCRIPT_SHA256)
+        assert self.downloads == 1
+
+        # Expired entries are downloaded again
+        cache.max_age = -1
+        with patch.object(cache.commands, "run", side_effect=self.fake_curl):
+            await cache.fetch()
+        assert self.downloads == 2
+
+    @pytest.mark.asyncio
+    async def test_rejects_checksum_mismatch(self, tmp_path):
+        cache = self.make_cache(tmp_path, sha256="0" * 64)
+
+        with patch.object(cache.commands, "run", side_effect=self.fake_curl):
+            with pytest.raises(InstallerCacheError):
+                await cache.fetch()
+        assert os.listdir(cache.cache_dir) == []
+
+    @pytest.mark.asyncio
+    async def test_download_failure(self, tmp_path):
+        cache = self.make_cache(tmp_path)
+
+        async def fail(*command, timeout=None):
+            return CommandResult(6, b"", b"Could not resolve host", 0.1)
+
+        with patch.object(cache.commands, "run", side_effect=fail):
+            with pytest.raises(InstallerCacheError, match="Could not resolve"):
+                await cache.fetch()
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -1,15 +1,21 @@
+import asyncio
+import json
 import sys
 
+
 print(sys.path)
 
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
+from dbus_next import Variant
 
 from r3onboard.network_manager_service import (
+    CommandRunner,
+    MonitoredDevice,
     NetworkManagerService,
-    ScanStatus,
     NetworkStatus,
+    ScanStatus,
 )
 
 
@@ -33,23 +39,19 @@ class TestNetworkManagerService:
             assert self.network_manager.wifi_status == NetworkStatus.CONNECTED
             mock_notifyWifi.assert_called_once()
 
-    @patch("r3onboard.network_manager_service.subprocess.run")
-    def test_get_current_ssid(self, mock_run):
-        # mock_run.return_value.stdout = "SSID: TestSSID\n"
+    @pytest.mark.asyncio
+    @patch(
+        "r3onboard.network_manager_service.CommandRunner.run",
+        new_callable=AsyncMock,
+    )
+    async def test_get_current_ssid(self, mock_run):
         mock_run.side_effect = [
-            # MagicMock(stdout=""),
             MagicMock(
-                stdout="""\
-1: lo: <LOOPBACK,UP,LOWER_UP> mtu 65536 qdisc noqueue state UNKNOWN mode DEFAULT group default qlen 1000
-    link/loopback 00:00:00:00:00:00 brd 00:00:00:00:00:00
-2: eth0: <NO-CARRIER,BROADCAST,MULTICAST,UP> mtu 1500 qdisc mq state DOWN mode DEFAULT group default qlen 1000
-    link/ether dc:a6:32:93:99:a6 brd ff:ff:ff:ff:ff:ff
-3: wlan0: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500 qdisc pfifo_fast state UP mode DORMANT group default qlen 1000
-    link/ether dc:a6:32:93:99:a7 brd ff:ff:ff:ff:ff:ff
-"""
+                returncode=0,
+                stdout=b"eth0:ethernet:unavailable\nwlx00c0ca9a4c28:wifi:connected\n",
             ),
             MagicMock(
-                stdout="""\
+                stdout=b"""\
 Connected to 68:d7:9a:4c:28:06 (on wlan0)
 	SSID: Artemis
 	freq: 2437
@@ -65,8 +67,60 @@ Connected to 68:d7:9a:4c:28:06 (on wlan0)
 """
             ),
         ]
-        ssid = self.network_manager.get_current_ssid()
+        ssid = await self.network_manager.get_current_ssid()
         assert ssid == "Artemis"
+        assert mock_run.call_args.args[:3] == ("iw", "dev", "wlx00c0ca9a4c28")
+
+    @pytest.mark.asyncio
+    @patch(
+        "r3onboard.network_manager_service.CommandRunner.run",
+        new_callable=AsyncMock,
+    )
+    async def test_current_ssid_from_active_access_point(self, mock_run):
+        self.network_manager.get_all_properties = AsyncMock(
+            return_value={
+                "Ssid": b"Artemis",
+                "HwAddress": "68:D7:9A:4C:28:06",
+                "Frequency": 5180,
+                "Strength": 72,
+            }
+        )
+
+        await self.network_manager.update_active_access_point("/device/1", "/ap/1")
+        await self.network_manager.refresh_current_ssid()
+
+        assert self.network_manager.current_ssid == "Artemis"
+        assert self.network_manager.current_bssid == "68:D7:9A:4C:28:06"
+        assert self.network_manager.current_frequency == 5180
+        assert self.network_manager.current_signal == 72
+        mock_run.assert_not_called()
+
+        await self.network_manager.update_active_access_point("/device/1", "/")
+        assert self.network_manager.current_ssid == ""
+
+    @pytest.mark.asyncio
+    async def test_link_of_the_activated_adapter(self):
+        self.network_manager.get_all_properties = AsyncMock(
+            return_value={"Ssid": b"Artemis", "HwAddress": "aa", "Strength": 72}
+        )
+        for path, name in (("/device/1", "wlan0"), ("/device/2", "wlx00c0ca9a4c28")):
+            self.network_manager.monitored_devices[path] = MonitoredDevice(
+                path, MagicMock(), name, "wlan"
+            )
+        self.network_manager.set_device_state("wlan0", "wlan", 100)
+
+        await self.network_manager.update_active_access_point("/device/1", "/ap/1")
+        # A second adapter that is not associated leaves the link alone
+        await self.network_manager.update_active_access_point("/device/2", "/")
+        assert self.network_manager.current_ssid == "Artemis"
+        assert self.network_manager.current_bssid == "aa"
+
+        self.network_manager.detach_device("/device/2")
+        await asyncio.sleep(0)
+        assert self.network_manager.current_ssid == "Artemis"
+        self.network_manager.detach_device("/device/1")
+        await asyncio.sleep(0)
+        assert self.network_manager.current_ssid == ""
 
     @pytest.mark.asyncio
     @patch(
@@ -79,30 +133,266 @@ Connected to 68:d7:9a:4c:28:06 (on wlan0)
         mock_proc.communicate = AsyncMock(
             return_value=(
                 b"""
-Artemis:39
+Artemis:68\\:D7\\:9A\\:4C\\:28\\:06:2437 MHz:39:WPA2
 """,
                 b"",
             )
         )
         mock_create_subprocess_exec.return_value = mock_proc
+        # No D-Bus wireless device, scan falls back to nmcli
+        self.network_manager.scan_wifi_networks_dbus = AsyncMock(return_value=False)
 
         await self.network_manager.scan_wifi_networks()
         assert self.network_manager.scan_status == ScanStatus.COMPLETE
         assert self.network_manager.networks == [("Artemis", 39)]
 
+    @pytest.mark.asyncio
     @patch(
-        "r3onboard.network_manager_service.subprocess.run",
+        "r3onboard.network_manager_service.asyncio.create_subprocess_exec",
+        new_callable=AsyncMock,
     )
-    def test_is_wifi_connected(self, mock_run):
-        # mock_proc.communicate = AsyncMock(return_value=(b"wlan0:connected\n", b""))
+    async def test_scan_wifi_networks_nmcli_escaped_colons(
+        self, mock_create_subprocess_exec
+    ):
+        mock_proc = MagicMock()
+        mock_proc.returncode = 0
+        mock_proc.communicate = AsyncMock(
+            return_value=(
+                b"Cafe\\:Guest:AA\\:BB\\:CC\\:DD\\:EE\\:FF:5180 MHz:52:--\n",
+                b"",
+            )
+        )
+        mock_create_subprocess_exec.return_value = mock_proc
+
+        await self.network_manager.scan_wifi_networks_nmcli()
+        assert self.network_manager.networks == [("Cafe:Guest", 52)]
+        record = self.network_manager.scan_results.best["Cafe:Guest"]
+        assert record.bssid == "AA:BB:CC:DD:EE:FF"
+        assert record.frequency == 5180
+        assert record.security == ""
+
+    @pytest.mark.asyncio
+    async def test_scan_wifi_networks_dbus(self):
+        paths = ["/ap/1", "/ap/2", "/ap/3"]
+        properties = {
+            "/ap/1": {"Ssid": b"Artemis", "Strength": 39},
+            "/ap/2": {
+                "Ssid": b"Artemis",
+                "HwAddress": "68:D7:9A:4C:28:07",
+                "Frequency": 5180,
+                "Strength": 60,
+                "Flags": 1,
+                "RsnFlags": 0x188,
+            },
+            "/ap/3": {"Ssid": b"Apollo", "Strength": 20},
+        }
+        wireless = MagicMock(path="/device/1")
+        wireless.call_request_scan = AsyncMock()
+        wireless.call_get_all_access_points = AsyncMock(return_value=paths)
+        device_object = MagicMock()
+        device_object.get_interface.return_value = wireless
+        self.network_manager.scan_timeout = 0.01
+        self.network_manager.get_wireless_devices = AsyncMock(
+            return_value=[device_object]
+        )
+        self.network_manager.get_all_properties = AsyncMock(
+            side_effect=lambda path, interface: properties[path]
+        )
+
+        assert await self.network_manager.scan_wifi_networks_dbus()
+        assert self.network_manager.scan_status == ScanStatus.COMPLETE
+        assert self.network_manager.networks == [("Artemis", 60), ("Apollo", 20)]
+        networks = json.loads(self.network_manager.get_wifi_json())
+        assert networks[0] == {
+            "ssid": "Artemis",
+            "signal": 60,
+            "bssid": "68:D7:9A:4C:28:07",
+            "freq": 5180,
+            "security": "WPA2",
+        }
+
+    @pytest.mark.asyncio
+    async def test_scan_keeps_access_points_of_other_devices(self):
+        properties = {
+            "/ap/1": {"Ssid": b"Cafe", "HwAddress": "aa", "Strength": 50},
+            "/ap/2": {"Ssid": b"Home", "HwAddress": "bb", "Strength": 70},
+        }
+        devices = []
+        for device_path, ap_path in (("/device/1", "/ap/1"), ("/device/2", "/ap/2")):
+            wireless = MagicMock(path=device_path)
+            wireless.call_request_scan = AsyncMock()
+            wireless.call_get_all_access_points = AsyncMock(return_value=[ap_path])
+            device_object = MagicMock()
+            device_object.get_interface.return_value = wireless
+            devices.append(device_object)
+        self.network_manager.scan_timeout = 0.01
+        self.network_manager.get_wireless_devices = AsyncMock(return_value=devices)
+        self.network_manager.get_all_properties = AsyncMock(
+            side_effect=lambda path, interface: properties[path]
+        )
+
+        assert await self.network_manager.scan_wifi_networks_dbus()
+        assert self.network_manager.networks == [("Home", 70), ("Cafe", 50)]
+
+    def test_get_wifi_page_json(self):
+        self.network_manager.set_networks({"Artemis": 39, "Apollo": 70, "Gemini": 10})
+        self.network_manager.complete_generation()
+        generation = self.network_manager.scan_generation
+        self.network_manager.set_networks({"Artemis": 45, "Apollo": 70})
+        self.network_manager.complete_generation()
+
+        page = json.loads(self.network_manager.get_wifi_page_json(offset=1, limit=1))
+        assert page["full"]
+        assert page["total"] == 2
+        assert page["networks"] == [{"ssid": "Artemis", "signal": 45}]
+
+        delta = json.loads(self.network_manager.get_wifi_page_json(since=generation))
+        assert not delta["full"]
+        assert delta["networks"] == [{"ssid": "Artemis", "signal": 45}]
+        assert delta["removed"] == ["Gemini"]
+
+    def test_generation_advances_once_per_scan(self):
+        for index in range(20):
+            self.network_manager.scan_results.add(
+                f"{index:02x}", f"ssid{index}", 2437, 50
+            )
+            self.network_manager.publish_access_points()
+        self.network_manager.complete_generation()
+        generation = self.network_manager.scan_generation
+        assert generation == 1
+
+        # Signals between scans do not move the generation on their own
+        for index in range(18):
+            self.network_manager.scan_results.add(
+                f"{index:02x}", f"ssid{index}", 2437, 60
+            )
+            self.network_manager.publish_access_points()
+        delta = json.loads(self.network_manager.get_wifi_page_json(since=generation))
+        assert not delta["full"]
+        assert len(delta["networks"]) == 18
+        self.network_manager.complete_generation()
+        assert self.network_manager.scan_generation == 2
+
+    def test_scan_interval_backs_off(self):
+        self.network_manager.active_scan_interval = 10
+        self.network_manager.idle_scan_interval = 60
+        self.network_manager.idle_scans = 5
+        assert self.network_manager.scan_interval() == 60
+
+        self.network_manager.set_clients_connected(True)
+        assert self.network_manager.scan_interval() == 10
+
+        self.network_manager.wifi_status = NetworkStatus.CONNECTED
+        assert (
+            self.network_manager.scan_interval()
+            == self.network_manager.connected_scan_interval
+        )
+
+    @pytest.mark.asyncio
+    async def test_schedule_scans_ages_out_results(self):
+        self.network_manager.scan_results.add("aa", "Artemis", 2437, 40, now=0.0)
+        self.network_manager.publish_access_points()
+        scanned = asyncio.Event()
+
+        async def scan():
+            scanned.set()
+
+        task = asyncio.create_task(self.network_manager.schedule_scans(scan))
+        await asyncio.wait_for(scanned.wait(), 1)
+        task.cancel()
+
+        assert self.network_manager.networks == []
+        assert self.network_manager.idle_scans == 1
+
+    @pytest.mark.asyncio
+    async def test_saved_connections_mark_known_networks(self):
+        connection = MagicMock()
+        connection.call_get_settings = AsyncMock(
+            return_value={"802-11-wireless": {"ssid": Variant("ay", b"Artemis")}}
+        )
+        self.network_manager.system_bus.get_interface = AsyncMock(
+            return_value=connection
+        )
+        self.network_manager.set_networks({"Artemis": 39, "Apollo": 70})
+        self.network_manager.complete_generation()
+        generation = self.network_manager.scan_generation
+
+        await self.network_manager.index_connection("/settings/4")
+        self.network_manager.saved_connections_loaded = True
+        assert await self.network_manager.find_connection("Artemis") == "/settings/4"
+        delta = json.loads(self.network_manager.get_wifi_page_json(since=generation))
+        assert delta["networks"] == [{"ssid": "Artemis", "signal": 39, "known": True}]
+
+        self.network_manager.unindex_connection("/settings/4")
+        networks = json.loads(self.network_manager.get_wifi_json())
+        assert all("known" not in network for network in networks)
+
+    @pytest.mark.asyncio
+    async def test_hot_plugged_devices(self):
+        device_interface = MagicMock()
+        device_interface.get_device_type = AsyncMock(return_value=1)
+        device_interface.get_interface = AsyncMock(return_value="eth1")
+        device_interface.get_state = AsyncMock(return_value=100)
+        device_object = MagicMock()
+        device_object.get_interface.return_value = device_interface
+        self.network_manager.system_bus.get_proxy_object = AsyncMock(
+            return_value=device_object
+        )
+
+        await self.network_manager.attach_device("/devices/7")
+        await self.network_manager.attach_device("/devices/7")
+        assert self.network_manager.is_device_type_connected("eth")
+        device_interface.on_state_changed.assert_called_once()
+
+        self.network_manager.detach_device("/devices/7")
+        assert not self.network_manager.is_device_type_connected("eth")
+        assert self.network_manager.ethernet_status == NetworkStatus.NOT_CONNECTED
+        device_interface.off_state_changed.assert_called_once()
+
+    @pytest.mark.asyncio
+    @patch(
+        "r3onboard.network_manager_service.CommandRunner.run",
+        new_callable=AsyncMock,
+    )
+    async def test_is_wifi_connected(self, mock_run):
         mock_run.side_effect = [
-            MagicMock(stdout=b"wlan0:connected\n"),
+            MagicMock(returncode=0, stdout=b"wlan0:wifi:connected\n"),
         ]
 
-        result = self.network_manager.is_wifi_connected()
+        result = await self.network_manager.is_wifi_connected()
         assert result
         assert self.network_manager.wifi_status == NetworkStatus.CONNECTED
 
+    @pytest.mark.asyncio
+    @patch(
+        "r3onboard.network_manager_service.CommandRunner.run",
+        new_callable=AsyncMock,
+    )
+    async def test_connection_checks_share_device_states(self, mock_run):
+        mock_run.side_effect = [
+            MagicMock(
+                returncode=0,
+                stdout=(
+                    b"wlan0:wifi:disconnected\n"
+                    b"enx00e04c680001:ethernet:connected (externally)\n"
+                ),
+            ),
+        ]
+
+        assert not await self.network_manager.is_wifi_connected()
+        assert await self.network_manager.is_ethernet_connected()
+        mock_run.assert_called_once()
+
+        # StateChanged keeps the table current without nmcli, whatever the
+        # adapter is called
+        handler = self.network_manager.create_state_changed_handler(
+            "wlan", "wlx00c0ca9a4c28"
+        )
+        handler(100, 40, 0)
+        assert self.network_manager.wifi_status == NetworkStatus.CONNECTED
+        assert await self.network_manager.is_wifi_connected()
+        mock_run.assert_called_once()
+
     @pytest.mark.asyncio
     @patch(
         "r3onboard.network_manager_service.asyncio.create_subprocess_exec",
@@ -113,11 +403,125 @@ Artemis:39
         mock_proc.returncode = 0
         mock_proc.communicate = AsyncMock(return_value=(b"", b""))
         mock_create_subprocess_exec.return_value = mock_proc
+        # No D-Bus wireless device, connect falls back to nmcli
+        self.network_manager.activate_wifi_dbus = AsyncMock(return_value=None)
 
         result = await self.network_manager.configure_wifi_async("TestSSID", "password")
         assert result
         assert self.network_manager.wifi_status == NetworkStatus.CONNECTING
 
+    @pytest.mark.asyncio
+    async def test_activate_wifi_dbus(self):
+        handlers = []
+        nm_interface = MagicMock()
+        nm_interface.call_add_and_activate_connection = AsyncMock(
+            return_value=["/settings/1", "/active/1"]
+        )
+        active = MagicMock()
+        active.on_state_changed.side_effect = handlers.append
+        system_bus = self.network_manager.system_bus
+        system_bus.get_interface = AsyncMock(
+            side_effect=lambda service, path, interface: (
+                active if path == "/active/1" else nm_interface
+            )
+        )
+        self.network_manager.get_wireless_devices = AsyncMock(
+            return_value=[MagicMock(path="/device/1")]
+        )
+        self.network_manager.find_connection = AsyncMock(return_value=None)
+        # Still activating when read
+        self.network_manager.get_property = AsyncMock(return_value=1)
+
+        attempt = asyncio.create_task(
+            self.network_manager.configure_wifi_async("Artemis", "password")
+        )
+        while not handlers:
+            await asyncio.sleep(0)
+        handlers[0](4, 9)
+
+        assert not await attempt
+        assert self.network_manager.error == NetworkStatus.INVALID_PASSWORD
+        values = nm_interface.call_add_and_activate_connection.await_args.args[0]
+        assert values["802-11-wireless"]["ssid"].value == b"Artemis"
+        assert values["802-11-wireless-security"]["psk"].value == "password"
+
+    @pytest.mark.asyncio
+    async def test_activation_times_out(self):
+        nm_interface = MagicMock()
+        nm_interface.call_deactivate_connection = AsyncMock()
+        self.network_manager.system_bus.get_interface = AsyncMock(
+            return_value=nm_interface
+        )
+        self.network_manager.get_property = AsyncMock(return_value=1)
+        self.network_manager.connect_timeout = 0.01
+
+        assert not await self.network_manager.wait_for_activation(
+            "Artemis", "/active/1"
+        )
+        assert self.network_manager.wifi_status == NetworkStatus.CONNECT_TIMEOUT
+        nm_interface.call_deactivate_connection.assert_awaited_once_with("/active/1")
+
+    @pytest.mark.asyncio
+    async def test_restored_state_is_stale_until_refreshed(self):
+        self.network_manager.scan_results.add("aa", "Artemis", 2437, 70, "WPA2")
+        self.network_manager._wifi_status = NetworkStatus.CONNECTED
+        self.network_manager._current_ssid = "Artemis"
+        state = json.loads(json.dumps(self.network_manager.export_state()))
+
+        restored = NetworkManagerService()
+        restored.restore_state(state)
+        assert restored.networks == [("Artemis", 70)]
+        assert restored.scan_results.best["Artemis"].security == "WPA2"
+        assert restored.scan_status == ScanStatus.COMPLETE
+        assert restored.wifi_status == NetworkStatus.CONNECTED
+        assert restored.stale
+
+        restored.on_change_network = MagicMock()
+        restored.is_wifi_connected = AsyncMock(return_value=True)
+        restored.is_ethernet_connected = AsyncMock(return_value=False)
+        await restored.check_connections()
+        assert restored.stale
+        restored.scan_wifi_networks_dbus = AsyncMock(return_value=True)
+        await restored.scan_wifi_networks()
+        assert not restored.stale
+        restored.on_change_network.assert_called_once_with("stale", "False")
+
+    def test_restore_drops_expired_access_points(self):
+        state = {
+            "wlan": NetworkStatus.CONNECTING,
+            "access_points": [["aa", "Artemis", 2437, 70, "", 0]],
+        }
+        self.network_manager.restore_state(state)
+        assert self.network_manager.networks == []
+        # A connection attempt does not survive a restart
+        assert self.network_manager.wifi_status == NetworkStatus.NOT_CONNECTED
+
+
+class TestCommandRunner:
+    def setup_method(self, method):
+        self.runner = CommandRunner(limit=1, timeout=0.01)
+
+    @pytest.mark.asyncio
+    @patch(
+        "r3onboard.network_manager_service.asyncio.create_subprocess_exec",
+        new_callable=AsyncMock,
+    )
+    async def test_kills_command_after_timeout(self, mock_create_subprocess_exec):
+        mock_proc = MagicMock()
+        mock_proc.returncode = None
+
+        async def hang():
+            await asyncio.sleep(1)
+
+        mock_proc.communicate = hang
+        mock_proc.wait = AsyncMock()
+        mock_create_subprocess_exec.return_value = mock_proc
+
+        result = await self.runner.run("systemctl", "restart", "NetworkManager")
+        assert result.returncode != 0
+        assert b"Timed out" in result.stderr
+        mock_proc.kill.assert_called_once()
+
 
 if __name__ == "__main__":
     pytest.main()
@@ -0,0 +1,51 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+
+from r3onboard.ble_framing import OutgoingMessage, Protocol
+from r3onboard.notification_queue import NotificationQueue
+
+
+class TestNotificationQueue:
+    @pytest.mark.asyncio
+    async def test_messages_are_not_interleaved(self):
+        sent = []
+        queue = NotificationQueue(
+            lambda uuid, chunk: sent.append(bytes(chunk)) or True, 0
+        )
+
+        first = queue.send("status", OutgoingMessage(b"aaaa", Protocol.LEGACY), 6)
+        second = queue.send("status", OutgoingMessage(b"bbbb", Protocol.LEGACY), 6)
+        assert await first
+        assert await second
+
+        assert b"".join(sent) == b"[START]aaaa[END][START]bbbb[END]"
+        queue.cancel()
+
+    @pytest.mark.asyncio
+    async def test_backs_off_when_congested(self):
+        send_chunk = MagicMock(side_effect=[False, False, True])
+        queue = NotificationQueue(send_chunk, 0)
+        queue.MIN_BACKOFF = 0
+
+        assert await queue.send("status", OutgoingMessage(b"a", Protocol.FRAMED), 20)
+        assert send_chunk.call_count == 3
+        assert queue.congested == 2
+        queue.cancel()
+
+    @pytest.mark.asyncio
+    async def test_drops_oldest_when_full(self):
+        queue = NotificationQueue(lambda uuid, chunk: True, 0, max_pending=1)
+
+        stale = queue.send("status", OutgoingMessage(b"a", Protocol.FRAMED), 20)
+        latest = queue.send("status", OutgoingMessage(b"b", Protocol.FRAMED), 20)
+
+        assert await stale is False
+        assert await latest is True
+        assert queue.dropped == 1
+        queue.cancel()
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,45 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from r3onboard.notification_scheduler import NotificationScheduler
+
+
+class TestNotificationScheduler:
+    @pytest.mark.asyncio
+    async def test_coalesces_changes_in_window(self):
+        send = AsyncMock()
+        scheduler = NotificationScheduler(0.01, send)
+
+        for _ in range(5):
+            scheduler.schedule("status")
+        await asyncio.sleep(0.05)
+
+        send.assert_awaited_once_with("status")
+        assert scheduler.coalesced == 4
+
+    @pytest.mark.asyncio
+    async def test_change_during_send_sends_once_more(self):
+        started = asyncio.Event()
+        release = asyncio.Event()
+        calls = []
+
+        async def send(key):
+            calls.append(key)
+            started.set()
+            await release.wait()
+
+        scheduler = NotificationScheduler(0, send)
+        scheduler.schedule("status")
+        await started.wait()
+        scheduler.schedule("status")
+        scheduler.schedule("status")
+        release.set()
+        await asyncio.sleep(0.05)
+
+        assert calls == ["status", "status"]
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -1,14 +1,20 @@
+import asyncio
+import json
 import sys
 
+
 print(sys.path)
 
+from collections import deque
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
+from r3onboard.installer_cache import InstallerCacheError
 from r3onboard.remoteit_service import (
-    RemoteItService,
+    RegistrationPhase,
     RegistrationStatus,
+    RemoteItService,
 )
 
 
@@ -43,23 +49,200 @@ class TestRemoteItService:
         assert self.remoteit.registration_status == RegistrationStatus.REGISTERED
         assert self.remoteit.device_id == "TestDeviceID"
 
+    @pytest.mark.asyncio
+    @patch(
+        "r3onboard.remoteit_service.asyncio.create_subprocess_exec",
+        new_callable=AsyncMock,
+    )
+    async def test_follow_journal(self, mock_create_subprocess_exec, tmp_path):
+        entries = [
+            {"MESSAGE": "Updating remote.it configuration.", "__CURSOR": "s=1"},
+            {"MESSAGE": "unrelated", "__CURSOR": "s=2"},
+            {"MESSAGE": "Using device uid = 80:00:00", "__CURSOR": "s=3"},
+        ]
+        mock_proc = MagicMock()
+        mock_proc.returncode = None
+        mock_proc.wait = AsyncMock()
+        mock_proc.stdout.readline = AsyncMock(
+            side_effect=[json.dumps(entry).encode() + b"\n" for entry in entries]
+            + [b"\n", b""]
+        )
+        mock_create_subprocess_exec.return_value = mock_proc
+        self.remoteit.cursor_file = str(tmp_path / "journal.cursor")
+
+        with patch.object(self.remoteit.config_watcher, "check") as mock_check:
+            await self.remoteit.follow_journal()
+            mock_check.assert_called_once()
+        assert self.remoteit.registration_status == RegistrationStatus.REGISTERING
+        assert self.remoteit.load_cursor() == "s=3"
+
+        # A restart resumes after the saved cursor
+        command = self.remoteit.journal_command(self.remoteit.load_cursor())
+        assert "--after-cursor=s=3" in command
+        assert "-o" in command and "json" in command
+        # Without one only new entries are followed
+        assert "-n" in self.remoteit.journal_command(None)
+
+    @pytest.mark.asyncio
+    @patch(
+        "r3onboard.remoteit_service.asyncio.create_subprocess_exec",
+        new_callable=AsyncMock,
+    )
+    async def test_follow_journal_drops_rejected_cursor(
+        self, mock_create_subprocess_exec, tmp_path
+    ):
+        mock_proc = MagicMock()
+        mock_proc.returncode = 1
+        mock_proc.wait = AsyncMock()
+        mock_proc.stdout.readline = AsyncMock(return_value=b"")
+        mock_create_subprocess_exec.return_value = mock_proc
+        self.remoteit.cursor_file = str(tmp_path / "journal.cursor")
+        self.remoteit.save_cursor("s=trunc")
+
+        await self.remoteit.follow_journal()
+        assert "--after-cursor=s=trunc" in mock_create_subprocess_exec.call_args.args
+        assert self.remoteit.load_cursor() is None
+
+    @pytest.mark.asyncio
+    @patch(
+        "r3onboard.remoteit_service.asyncio.create_subprocess_exec",
+        new_callable=AsyncMock,
+    )
+    async def test_follow_journal_skips_oversized_entries(
+        self, mock_create_subprocess_exec, tmp_path
+    ):
+        entry = {"MESSAGE": "Updating remote.it configuration.", "__CURSOR": "s=1"}
+        mock_proc = MagicMock()
+        mock_proc.returncode = None
+        mock_proc.wait = AsyncMock()
+        mock_proc.stdout = asyncio.StreamReader(limit=128)
+        mock_proc.stdout.feed_data(b'{"MESSAGE": "' + b"x" * 1000 + b'"}\n')
+        mock_proc.stdout.feed_data(json.dumps(entry).encode() + b"\n")
+        mock_proc.stdout.feed_eof()
+        mock_create_subprocess_exec.return_value = mock_proc
+        self.remoteit.cursor_file = str(tmp_path / "journal.cursor")
+
+        await self.remoteit.follow_journal()
+        assert self.remoteit.registration_status == RegistrationStatus.REGISTERING
+
+    def make_process(self, stdout, stderr, returncode=0):
+        process = MagicMock()
+        process.returncode = None
+        process.stdout = asyncio.StreamReader()
+        process.stdout.feed_data(stdout)
+        process.stdout.feed_eof()
+        process.stderr = asyncio.StreamReader()
+        process.stderr.feed_data(stderr)
+        process.stderr.feed_eof()
+
+        async def wait():
+            process.returncode = returncode
+            return returncode
+
+        process.wait = wait
+        return process
+
     @pytest.mark.asyncio
     @patch(
         "r3onboard.remoteit_service.asyncio.create_subprocess_shell",
         new_callable=AsyncMock,
     )
     async def test_install_remoteit_agent_async(self, mock_create_subprocess_shell):
-        mock_proc = MagicMock()
-        mock_proc.returncode = 0
-        mock_proc.communicate = AsyncMock(return_value=(b"", b""))
-        mock_create_subprocess_shell.return_value = mock_proc
+        mock_create_subprocess_shell.return_value = self.make_process(b"", b"")
+        self.remoteit.installer_cache.fetch = AsyncMock(
+            return_value="/var/cache/r3onboard/abc.sh"
+        )
 
         with patch.object(
             self.remoteit, "check_device_registration"
         ) as mock_check_device_registration:
-            await self.remoteit.install_remoteit_agent_async("TestCode")
+            await self.remoteit.install_remoteit_agent_async('Code"; reboot; "')
             assert self.remoteit.registration_status == RegistrationStatus.REGISTERING
             mock_check_device_registration.assert_called_once()
+        call = mock_create_subprocess_shell.call_args
+        assert call.args[0] == "sh /var/cache/r3onboard/abc.sh"
+        assert call.kwargs["env"]["R3_REGISTRATION_CODE"] == 'Code"; reboot; "'
+
+    @pytest.mark.asyncio
+    @patch(
+        "r3onboard.remoteit_service.asyncio.create_subprocess_shell",
+        new_callable=AsyncMock,
+    )
+    async def test_install_refuses_unverified_installer(
+        self, mock_create_subprocess_shell
+    ):
+        self.remoteit.installer_cache.sha256 = "0" * 64
+        self.remoteit.installer_cache.fetch = AsyncMock(
+            side_effect=InstallerCacheError("Checksum mismatch")
+        )
+
+        with patch.object(self.remoteit, "check_device_registration"):
+            _, stderr = await self.remoteit.install_remoteit_agent_async("TestCode")
+        assert stderr == "Checksum mismatch"
+        mock_create_subprocess_shell.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch(
+        "r3onboard.remoteit_service.asyncio.create_subprocess_shell",
+        new_callable=AsyncMock,
+    )
+    async def test_install_reports_phases(self, mock_create_subprocess_shell):
+        stdout = (
+            b"Downloading remoteit package\n"
+            b"Installing remoteit\n"
+            b"Registering device\n"
+            b"Starting remoteit services\n"
+        )
+        mock_create_subprocess_shell.return_value = self.make_process(
+            stdout, b"  % Total\r 50%\r100%\r"
+        )
+        self.remoteit.installer_cache.fetch = AsyncMock(return_value="/tmp/abc.sh")
+        self.remoteit.install_output = deque(maxlen=4)
+        phases = []
+        self.remoteit.on_change_registration = lambda key, value: (
+            phases.append(value) if key == "registration_phase" else None
+        )
+
+        def registered():
+            self.remoteit.set_registered("device-1")
+
+        with patch.object(
+            self.remoteit, "check_device_registration", side_effect=registered
+        ):
+            await self.remoteit.install_remoteit_agent_async("TestCode")
+
+        assert phases == [
+            RegistrationPhase.DOWNLOADING,
+            RegistrationPhase.INSTALLING,
+            RegistrationPhase.REGISTERING,
+            RegistrationPhase.STARTING,
+            RegistrationPhase.COMPLETE,
+        ]
+        assert self.remoteit.registration_progress == 100
+        # Only the last lines are kept
+        assert len(self.remoteit.install_output) == 4
+
+    @pytest.mark.asyncio
+    @patch(
+        "r3onboard.remoteit_service.asyncio.create_subprocess_shell",
+        new_callable=AsyncMock,
+    )
+    async def test_install_failure_reports_last_line(
+        self, mock_create_subprocess_shell
+    ):
+        mock_create_subprocess_shell.return_value = self.make_process(
+            b"Downloading remoteit package\n",
+            b"curl: (6) Could not resolve host",
+            returncode=6,
+        )
+        self.remoteit.installer_cache.fetch = AsyncMock(return_value="/tmp/abc.sh")
+
+        with patch.object(self.remoteit, "check_device_registration"):
+            _, error = await self.remoteit.install_remoteit_agent_async("TestCode")
+
+        assert self.remoteit.registration_phase == RegistrationPhase.FAILED
+        assert error == "curl: (6) Could not resolve host"
+        assert self.remoteit.registration_error == error
 
 
 if __name__ == "__main__":
@@ -0,0 +1,49 @@
+import pytest
+
+from r3onboard.scan_store import ScanStore, security_of
+
+
+class TestScanStore:
+    def setup_method(self, method):
+        self.store = ScanStore(capacity=3, clock=lambda: 0.0)
+
+    def test_aggregates_strongest_access_point_per_ssid(self):
+        self.store.add("aa", "Artemis", 2437, 40)
+        self.store.add("bb", "Artemis", 5180, 70, "WPA2")
+        self.store.add("cc", "Apollo", 2412, 20)
+        assert self.store.networks() == {"Artemis": 70, "Apollo": 20}
+        assert self.store.best["Artemis"].frequency == 5180
+
+        # The strongest access point weakens, the other one takes over
+        self.store.add("bb", "Artemis", 5180, 30, "WPA2")
+        assert self.store.best["Artemis"].bssid == "aa"
+
+        self.store.remove("aa")
+        self.store.remove("bb")
+        assert self.store.networks() == {"Apollo": 20}
+
+    def test_keeps_strongest_records_within_capacity(self):
+        self.store.add("aa", "Artemis", 2437, 40)
+        self.store.add("bb", "Apollo", 2437, 10)
+        self.store.add("cc", "Gemini", 2437, 60)
+        self.store.add("dd", "Mercury", 2437, 5)
+        self.store.add("ee", "Orion", 2437, 50)
+
+        assert len(self.store) == 3
+        assert self.store.networks() == {"Artemis": 40, "Gemini": 60, "Orion": 50}
+
+    def test_expire(self):
+        self.store.add("aa", "Artemis", 2437, 40, now=0.0)
+        self.store.add("bb", "Apollo", 2437, 10, now=50.0)
+        assert self.store.expire(30.0, now=60.0) == ["aa"]
+        assert self.store.networks() == {"Apollo": 10}
+
+    def test_security_of(self):
+        assert security_of(0, 0, 0) == ""
+        assert security_of(1, 0, 0) == "WEP"
+        assert security_of(1, 0x188, 0x188) == "WPA1 WPA2"
+        assert security_of(1, 0, 0x400) == "WPA3"
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+from r3onboard.state_store import STATE_VERSION, StateStore
+
+
+class TestStateStore:
+    def test_save_and_load(self, tmp_path):
+        store = StateStore(str(tmp_path / "state" / "state.json"))
+        state = {
+            "network": {"wlan": "CONNECTED"},
+            "registration": {"reg": "REGISTERED"},
+        }
+
+        assert store.save(state)
+        loaded = store.load()
+        assert loaded["version"] == STATE_VERSION
+        assert loaded["network"] == {"wlan": "CONNECTED"}
+        assert "saved_at" in loaded
+        assert not (tmp_path / "state" / "state.json.partial").exists()
+
+        # Unchanged state is not written again
+        assert not store.save(state)
+
+    def test_ignores_unusable_files(self, tmp_path):
+        path = tmp_path / "state.json"
+        store = StateStore(str(path))
+        assert store.load() is None
+
+        path.write_text("{not json")
+        assert store.load() is None
+
+        path.write_text(json.dumps({"version": STATE_VERSION + 1}))
+        assert store.load() is None
+
+    def test_disabled(self):
+        store = StateStore("")
+        assert not store.save({"network": {}})
+        assert store.load() is None
+
+
+if __name__ == "__main__":
+    pytest.main()
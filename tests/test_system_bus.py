@@ -0,0 +1,40 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from r3onboard.system_bus import SystemBus
+
+
+class TestSystemBus:
+    def setup_method(self, method):
+        self.system_bus = SystemBus()
+        self.bus = MagicMock()
+        self.bus.connected = True
+        self.bus.introspect = AsyncMock(return_value=MagicMock())
+
+    @pytest.mark.asyncio
+    async def test_connects_once(self):
+        message_bus = MagicMock()
+        message_bus.return_value.connect = AsyncMock(return_value=self.bus)
+        with patch("r3onboard.system_bus.MessageBus", message_bus):
+            assert await self.system_bus.get_bus() is self.bus
+            assert await self.system_bus.get_bus() is self.bus
+        message_bus.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_caches_introspection_until_invalidated(self):
+        self.system_bus.bus = self.bus
+        device = "/org/freedesktop/NetworkManager/Devices/3"
+
+        first = await self.system_bus.get_interface("svc", device, "iface")
+        second = await self.system_bus.get_interface("svc", device, "iface")
+        assert first is second
+        self.bus.introspect.assert_awaited_once_with("svc", device)
+
+        self.system_bus.invalidate("svc", "/org/freedesktop/NetworkManager/Devices")
+        await self.system_bus.get_interface("svc", device, "iface")
+        assert self.bus.introspect.await_count == 2
+
+
+if __name__ == "__main__":
+    pytest.main()